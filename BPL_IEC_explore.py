@@ -52,6 +52,9 @@
 # 2023-04-24 - Correcteion of plotType 'Elution' concerning handling of time
 # 2023-05-31 - Adjusted to from importlib.meetadata import version
 # 2023-09-13 - Updated to FMU-explore 0.9.8 and introduced proces diagram
+# 2026-10-17 - Headless mode with simu(plot=False) and import of matplotlib deferred to first diagram
+# 2026-10-17 - Added snapshot() and restore() with FMU state for 'cont' and checked _0 mapping as fallback
+# 2026-10-17 - Added solver profiles selected by simu(profile=...) as in BPL_IEC_fmpy_explore.py
 #------------------------------------------------------------------------------------------------------------------
 
 #------------------------------------------------------------------------------------------------------------------
@@ -61,9 +64,11 @@
 import sys
 import platform
 import locale
+import importlib
+import hashlib
+import pickle
+import zlib
 import numpy as np 
-import matplotlib.pyplot as plt
-import matplotlib.image as img
 import zipfile 
  
 from pyfmi import load_fmu
@@ -72,6 +77,19 @@ from pyfmi.fmi import FMUException
 from itertools import cycle
 from importlib.metadata import version   
 
+# Matplotlib is imported first when a diagram is made
+class LazyModule:
+   """Stand-in for a module that is imported at the first attribute access"""
+   def __init__(self, name):
+      self.__dict__['_name'] = name
+   def __getattr__(self, attr):
+      return getattr(importlib.import_module(self._name), attr)
+   def __setattr__(self, attr, value):
+      setattr(importlib.import_module(self._name), attr, value)
+
+plt = LazyModule('matplotlib.pyplot')
+img = LazyModule('matplotlib.image')
+
 # Set the environment - for Linux a JSON-file in the FMU is read
 if platform.system() == 'Linux': locale.setlocale(locale.LC_ALL, 'en_US.UTF-8')
 
@@ -118,6 +136,22 @@ elif flag_type in ['ME', 'me']:
    opts_std['result_handling'] = 'binary'  
 else:    
    print('There is no FMU for this platform')
+
+# Solver profiles selected by simu(profile=...), the same as in BPL_IEC_fmpy_explore.py, given as 
+# relative tolerance and max step [min] of CVode where None keeps the default of opts_std. A CS FMU 
+# integrates with its own solver and the profiles are not used.
+solver_profiles = {'screening': {'rtol': 1e-3, 'maxh': None},
+                   'standard': {'rtol': None, 'maxh': None},
+                   'reference': {'rtol': 1e-9, 'maxh': 1.0}}
+
+def solver_options(options=opts_std, profile='standard'):
+   """Return a copy of options with the CVode settings of profile in solver_profiles"""
+   options = dict(options)
+   if flag_type in ['ME', 'me']:
+      CVode_options = dict(options['CVode_options'])
+      CVode_options.update({k: v for k, v in solver_profiles[profile].items() if v is not None})
+      options['CVode_options'] = CVode_options
+   return options
   
 # Provide various MSL and BPL versions
 if flag_vendor in ['JM', 'jm']:
@@ -154,6 +188,25 @@ global stateDict; stateDict =  {}
 stateDict = model.get_states_list()
 stateDict.update(timeDiscreteStates)
 
+# Name of the parameter that holds the initial value of a state, e.g. a.c[3] -> a.c_0[3]
+def state_start_name(key):
+   base, bracket, index = key.rpartition('[') if key[-1] == ']' else (key, '', '')
+   if base[-3:] == 'I.y':
+      base = base[:-10]+'I'
+   elif base[-3:] == 'D.x':
+      base = base[:-10]+'D'
+   return base + '_0' + bracket + index
+
+# Create stateDictInitial with the parameters used for initialization in 'cont' without FMU state
+global stateDictInitial; stateDictInitial = {}
+model_variables = model.get_model_variables()
+for key in stateDict.keys():
+   if state_start_name(key) in model_variables:
+      stateDictInitial[key] = state_start_name(key)
+   else:
+      print('Error: no initial value parameter', state_start_name(key), 'for state', key)
+del model_variables
+
 # Create dictionaries parDict and parLocation
 global parDict; parDict = {}
 
@@ -1106,6 +1159,11 @@ def setLines(lines=['-','--',':','-.']):
    global linecycler
    linecycler = cycle(lines)
 
+setLines()
+
+# Headless use, e.g. batch and server, where simu() does not evaluate any diagrams
+global headless; headless = False
+
 # Show plots from sim_res, just that
 def show(diagrams=diagrams):
    """Show diagrams chosen by newplot()"""
@@ -1114,14 +1172,77 @@ def show(diagrams=diagrams):
    # Plot diagrams 
    for command in diagrams: eval(command)
 
+# Simulation state at prevFinalTime that simu(mode='cont') continues from
+class Snapshot:
+   """State at the end of a simulation. When the FMU supports it the complete FMU state is kept
+      serialized, including discrete controller states, and the continuation is exact. Otherwise 
+      only the continuous states in stateDict are kept and the FMU is initialised again with 
+      these as _0 parameters."""
+
+   def __init__(self, time, stateDict, parDict, fmu_hash, fmu_state=None):
+      self.time = time
+      self.stateDict = dict(stateDict)
+      self.parDict = dict(parDict)
+      self.fmu_hash = fmu_hash
+      self.fmu_state = fmu_state
+
+   def exact(self):
+      return self.fmu_state is not None
+
+   def to_bytes(self):
+      """Snapshot as bytes to store on disk or send to another process"""
+      return zlib.compress(pickle.dumps(self.__dict__, protocol=pickle.HIGHEST_PROTOCOL))
+
+   @staticmethod
+   def from_bytes(data):
+      snapshot = Snapshot.__new__(Snapshot)
+      snapshot.__dict__.update(pickle.loads(zlib.decompress(data)))
+      return snapshot
+
+global current_snapshot; current_snapshot = None
+global fmu_hash; fmu_hash = None
+
+# Help functions for the FMU state
+def get_fmu_hash():
+   global fmu_hash
+   if fmu_hash is None:
+      with open(fmu_model, 'rb') as f: fmu_hash = hashlib.sha256(f.read()).hexdigest()
+   return fmu_hash
+
+def can_snapshot():
+   flags = model.get_capability_flags()
+   return flags.get('canGetAndSetFMUstate', False) and flags.get('canSerializeFMUstate', False)
+
+def snapshot():
+   """Return Snapshot of the simulation state at the end of the last simu(), use snapshot().to_bytes() to store"""
+   if current_snapshot is None:
+      print('Error: No simulation done')
+      return None
+   return current_snapshot
+
+def restore(snapshot):
+   """Restore simulation state from a Snapshot or its bytes, then simu(mode='cont') continues from it.
+      Parameters are restored too and a later par() makes the continuation go through _0 parameters."""
+   global current_snapshot, prevFinalTime
+   if isinstance(snapshot, bytes): snapshot = Snapshot.from_bytes(snapshot)
+   if snapshot.fmu_hash != get_fmu_hash():
+      print('Error: Snapshot is from another FMU than', fmu_model)
+      return
+   parDict.update(snapshot.parDict)
+   stateDict.update(snapshot.stateDict)
+   prevFinalTime = snapshot.time
+   current_snapshot = snapshot
+
 # Simulation
 def simu(simulationTimeLocal=simulationTime, mode='Initial', options=opts_std, \
-         diagrams=diagrams,timeDiscreteStates=timeDiscreteStates):         
+         diagrams=diagrams,timeDiscreteStates=timeDiscreteStates, plot=None, profile=None):         
    """Model loaded and given intial values and parameter before,
-      and plot window also setup before."""
+      and plot window also setup before. With plot=False, or plot=None and 
+      headless=True, no diagrams are evaluated. With profile one of solver_profiles 
+      the CVode settings of options are replaced by those of the profile."""
     
    # Global variables
-   global model, parDict, stateDict, prevFinalTime, simulationTime, sim_res, t
+   global model, parDict, stateDict, prevFinalTime, simulationTime, sim_res, t, current_snapshot
    
    # Simulation flag
    simulationDone = False
@@ -1136,6 +1257,13 @@ def simu(simulationTimeLocal=simulationTime, mode='Initial', options=opts_std, \
          print('Value missing:', key)
          value_missing =+1
    if value_missing>0: return
+
+   # Solver profile
+   if profile is not None:
+      if profile not in solver_profiles:
+         print('Error: Solver profile not correct, one of', list(solver_profiles.keys()))
+         return
+      options = solver_options(options, profile)
          
    # Load model
    if model is None:
@@ -1154,29 +1282,24 @@ def simu(simulationTimeLocal=simulationTime, mode='Initial', options=opts_std, \
 
       if prevFinalTime == 0: 
          print("Error: Simulation is first done with default mode = init'")      
+      
+      elif current_snapshot is not None and current_snapshot.exact() and current_snapshot.parDict == parDict:
+         
+         # Continue from the FMU state
+         model.set_fmu_state(model.deserialize_fmu_state(current_snapshot.fmu_state))
+         sim_res = model.simulate(start_time=prevFinalTime,
+                                  final_time=prevFinalTime + simulationTime,
+                                  options=dict(options, initialize=False))
+         simulationDone = True
+         
       else:
          
          # Set parameters and intial state values:
          for key in parDict.keys():
             model.set(parLocation[key],parDict[key])                
 
-         for key in stateDict.keys():
-            if not key[-1] == ']':
-               if key[-3:] == 'I.y': 
-                  model.set(key[:-10]+'I_0', stateDict[key]) 
-               elif key[-3:] == 'D.x': 
-                  model.set(key[:-10]+'D_0', stateDict[key]) 
-               else:
-                  model.set(key+'_0', stateDict[key])
-            elif key[-3] == '[':
-               model.set(key[:-3]+'_0'+key[-3:], stateDict[key]) 
-            elif key[-4] == '[':
-               model.set(key[:-4]+'_0'+key[-4:], stateDict[key]) 
-            elif key[-5] == '[':
-               model.set(key[:-5]+'_0'+key[-5:], stateDict[key]) 
-            else:
-               print('The state vecotr has more than 1000 states')
-               break
+         for key in stateDictInitial.keys():
+            model.set(stateDictInitial[key], stateDict[key])
 
          # Simulate
          sim_res = model.simulate(start_time=prevFinalTime,
@@ -1192,14 +1315,24 @@ def simu(simulationTimeLocal=simulationTime, mode='Initial', options=opts_std, \
       t = sim_res['time']
  
       # Plot diagrams
-      linetype = next(linecycler)    
-      for command in diagrams: eval(command)
+      if plot is None: plot = not headless
+      if plot:
+         linetype = next(linecycler)    
+         for command in diagrams: eval(command)
             
       # Store final state values stateDict:
       for key in list(stateDict.keys()): stateDict[key] = model.get(key)[0]        
 
       # Store time from where simulation will start next time
       prevFinalTime = model.time
+      
+      # Snapshot for the next 'cont', with FMU state if supported
+      fmu_state = None
+      if can_snapshot():
+         state = model.get_fmu_state()
+         fmu_state = model.serialize_fmu_state(state)
+         model.free_fmu_state(state)
+      current_snapshot = Snapshot(prevFinalTime, stateDict, parDict, get_fmu_hash(), fmu_state)
    
    else:
       print('Error: No simulation done')
@@ -0,0 +1,451 @@
+# Benchmark - Simulation of IEC with FMPy
+#             timing of the explore framework BPL_IEC_fmpy_explore.py
+#
+# Run from the command line in the repository directory:  python BPL_IEC_fmpy_benchmark.py
+# The suite for regressions, see benchmark_suite(), is run with:
+#    python BPL_IEC_fmpy_benchmark.py --suite --output results.json --baseline baseline.json
+# The checks of consistency against the FMU, see the section Checks, are run with:
+#    python BPL_IEC_fmpy_benchmark.py --check
+#------------------------------------------------------------------------------------------------------------------
+# 2026-10-17 - Created with comparison of per-call overhead of simulate_fmu() and FMUEngine
+# 2026-10-17 - Added startup benchmark of import time and headless simulation
+# 2026-10-17 - Added benchmark of import-to-first-simulation with and without model metadata sidecar
+# 2026-10-17 - Added benchmark and cross-validation of the NumPy column backend against the FMU
+# 2026-10-17 - Added benchmark of the ensemble of ColumnModel against a loop over members
+# 2026-10-17 - Added benchmark of the coloured finite difference Jacobian against the dense one of CVode
+# 2026-10-17 - Added benchmark matrix of the solver profiles with KPI and peak error against 'reference'
+# 2026-10-17 - Added suite of the hot paths written as JSON and compared against a stored baseline
+#------------------------------------------------------------------------------------------------------------------
+
+import os
+import sys
+import io
+import re
+import json
+import time
+import shutil
+import inspect
+import platform
+import argparse
+import contextlib
+import subprocess
+import numpy as np
+
+import BPL_IEC_fmpy_explore as explore
+
+from fmpy import simulate_fmu
+
+# Simulation time that covers all switch points of the default parDict
+cycleTime = explore.cycleTime
+
+#------------------------------------------------------------------------------------------------------------------
+#  Help functions
+#------------------------------------------------------------------------------------------------------------------
+
+def timeit(function, repeat=10):
+   """Call function repeat times and return array of wall-clock times [s]"""
+   times = np.zeros(repeat)
+   for k in range(repeat):
+      tic = time.perf_counter()
+      function()
+      times[k] = time.perf_counter() - tic
+   return times
+
+def report(label, times):
+   print(f'{label:<40s} median {1000*np.median(times):8.1f} ms   min {1000*np.min(times):8.1f} ms')
+
+#------------------------------------------------------------------------------------------------------------------
+#  Benchmarks
+#------------------------------------------------------------------------------------------------------------------
+
+def benchmark_engine(simulationTimes=[0.01, 100.0], repeat=10):
+   """Compare simulate_fmu() from scratch with the warm FMUEngine used by simu().
+      The shortest simulationTime shows the fixed per-call overhead."""
+   start_values = {explore.parLocation[k]:explore.parDict[k] for k in explore.parDict.keys()}
+   output = list(explore.stateDict.keys()) + explore.key_variables
+   print()
+   print('Per-call cost of simulation - cold simulate_fmu() vs warm FMUEngine')
+   for simulationTime in simulationTimes:
+      def cold():
+         simulate_fmu(filename=explore.fmu_model, validate=False, start_time=0, stop_time=simulationTime,
+                      output_interval=simulationTime/explore.opts_std['NCP'], start_values=start_values,
+                      output=output)
+      def warm():
+         explore.engine.simulate(start_time=0, stop_time=simulationTime,
+                                 output_interval=simulationTime/explore.opts_std['NCP'],
+                                 start_values=start_values, output=output)
+      warm()
+      times_cold = timeit(cold, repeat)
+      times_warm = timeit(warm, repeat)
+      report(f'simulationTime={simulationTime} cold', times_cold)
+      report(f'simulationTime={simulationTime} warm', times_warm)
+      print(f'{"":<40s} saved  {1000*(np.median(times_cold)-np.median(times_warm)):8.1f} ms per call')
+
+def benchmark_startup(repeat=5):
+   """Import time of the explore module in a fresh interpreter, with and without matplotlib 
+      imported up front, and whether a headless simulation brings in matplotlib"""
+   script_import = ("import time; tic = time.perf_counter(); import BPL_IEC_fmpy_explore; "
+                    "print(time.perf_counter() - tic)")
+   script_import_plt = ("import time; tic = time.perf_counter(); import matplotlib.pyplot; "
+                        "import BPL_IEC_fmpy_explore; print(time.perf_counter() - tic)")
+   script_headless = ("import sys, time; tic = time.perf_counter(); import BPL_IEC_fmpy_explore as explore; "
+                      "explore.headless = True; explore.simu(); "
+                      "print(time.perf_counter() - tic, 'matplotlib' in sys.modules)")
+   def run(script):
+      return subprocess.run([sys.executable, '-c', script], capture_output=True, text=True).stdout.split('\n')[-2]
+   print()
+   print('Startup - import of BPL_IEC_fmpy_explore in a fresh interpreter')
+   report('import, matplotlib deferred', np.array([float(run(script_import)) for k in range(repeat)]))
+   report('import, matplotlib imported first', np.array([float(run(script_import_plt)) for k in range(repeat)]))
+   times, matplotlib_loaded = zip(*[run(script_headless).split() for k in range(repeat)])
+   report('import and headless simu()', np.array(times, dtype=float))
+   print(f'{"":<40s} matplotlib imported: {matplotlib_loaded[0]}')
+
+def benchmark_first_simulation(repeat=5):
+   """Import-to-first-simulation latency in a fresh interpreter, cold with the sidecar directory 
+      .fmu_explore removed so the FMU is parsed, and warm with the model metadata read from the sidecar"""
+   script = ("import time; tic = time.perf_counter(); import BPL_IEC_fmpy_explore as explore; "
+             "explore.simu(plot=False, cache=False); print(time.perf_counter() - tic)")
+   sidecar_dir = os.path.dirname(explore.engine.sidecar('meta'))
+   def run():
+      return float(subprocess.run([sys.executable, '-c', script], capture_output=True, text=True).stdout.split('\n')[-2])
+   def cold():
+      shutil.rmtree(sidecar_dir, ignore_errors=True)
+      return run()
+   print()
+   print('Import-to-first-simulation - model metadata parsed from FMU vs read from sidecar')
+   report('cold, no sidecar', np.array([cold() for k in range(repeat)]))
+   report('warm, sidecar', np.array([run() for k in range(repeat)]))
+
+def benchmark_column_backend(sections=[4, 8, 16, 32], repeat=3, simulationTime=cycleTime):
+   """Simulation time of the FMU and of ColumnModel driven by the same inlet, the difference of the 
+      outlet concentrations at 8 sections relative to their peak, and grid convergence of the 
+      outlet peak of P with the number of sections"""
+   names = [f'column.column_section[8].outlet.c[{i}]' for i in range(1, 4)]
+   explore.simu(simulationTime, plot=False, cache=False, diagrams=names)
+   fmu_res = explore.sim_res
+   print()
+   print('Column backend - FMU vs ColumnModel driven by the inlet recorded from the FMU')
+   report('FMU simu()', timeit(lambda: explore.simu(simulationTime, plot=False, cache=False, diagrams=names), repeat))
+   for n in sections:
+      report(f'ColumnModel sections={n}', timeit(lambda: explore.column_simulate(fmu_res, n), repeat))
+   column_res = explore.column_simulate(fmu_res, 8)
+   for name, label in zip(names, ['P', 'A', 'E']):
+      difference = np.max(np.abs(column_res[name] - fmu_res[name]))/max(np.max(np.abs(fmu_res[name])), 1e-12)
+      print(f'{"outlet " + label + " at 8 sections":<40s} max difference {100*difference:8.3f} % of peak')
+   for n in sections:
+      column_res = explore.column_simulate(fmu_res, n)
+      peak = np.max(column_res[f'column.column_section[{n}].outlet.c[1]'])
+      print(f'{"outlet P peak sections=" + str(n):<40s} {peak:10.4e}')
+
+def benchmark_ensemble(members=[10, 100, 1000], loop=10, simulationTime=cycleTime):
+   """Throughput of Monte Carlo over k1..k4 as one ensemble solve compared to a loop of 
+      column_simulate() over the members, and the largest difference between the two"""
+   explore.simu(simulationTime, plot=False, cache=False)
+   fmu_res = explore.sim_res
+   rng = np.random.default_rng(1)
+   print()
+   print('Ensemble of ColumnModel - one solve for all members vs loop over members')
+   for M in members:
+      ensemble = {k: explore.parDict[k]*rng.lognormal(0, 0.1, M) for k in ['k1', 'k2', 'k3', 'k4']}
+      tic = time.perf_counter()
+      _, names, y = explore.column_ensemble(ensemble, fmu_res)
+      t_ensemble = time.perf_counter() - tic
+      parDict_saved = explore.parDict.copy()
+      difference = 0
+      tic = time.perf_counter()
+      for member in range(min(M, loop)):
+         explore.parDict.update({k: v[member] for k, v in ensemble.items()})
+         column_res = explore.column_simulate(fmu_res)
+         difference = max(difference, np.max(np.abs(np.stack([column_res[n] for n in names], axis=-1) - y[member])))
+      t_loop = (time.perf_counter() - tic)/min(M, loop)
+      explore.parDict.update(parDict_saved)
+      print(f'{"members=" + str(M):<40s} ensemble {M/t_ensemble:8.1f} /s   loop {1/t_loop:8.1f} /s   '
+            f'difference {difference:.2e}')
+
+def benchmark_jacobian(simulationTime=100.0, repeat=10):
+   """Jacobian evaluations, derivative evaluations and wall-clock time of the standard run of the 
+      ME FMU with the Jacobian by coloured finite differences and by CVode itself"""
+   if explore.engine.metadata()['type'] != 'ME': return
+   jacobian_saved = explore.engine.jacobian
+   colors = explore.jacobian_colors(explore.engine.metadata()['sparsity'])
+   print()
+   print(f'Jacobian of CVode - {len(colors)} states in {colors.max() + 1} groups of columns')
+   results = {}
+   for jacobian in ['dense', 'colored']:
+      explore.engine.jacobian = jacobian
+      times = timeit(lambda: explore.simu(simulationTime, plot=False, cache=False), repeat)
+      statistics = explore.engine.solver_statistics
+      results[jacobian] = explore.sim_res
+      report(f'jacobian={jacobian}', times)
+      print(f'{"":<40s} jacobians {statistics["jacobians"]:6d}   derivatives {statistics["rhs"]:6d}'
+            f' + {statistics["rhs_jacobian"]:6d} for jacobians   steps {statistics["steps"]:6d}')
+   explore.engine.jacobian = jacobian_saved
+   difference = max(np.max(np.abs(results['colored'][n] - results['dense'][n])) 
+                    for n in results['dense'].dtype.names if results['dense'][n].dtype != bool)
+   print(f'{"largest difference":<40s} {difference:.2e}')
+
+def benchmark_profiles(simulationTime=cycleTime, repeat=5, profiles=None, signal='uv_detector.value', floor=1e-6):
+   """Wall-clock time, solver steps and the error of the KPIs and of the peak of signal against the 
+      profile 'reference' for each solver profile over a full cycle. The KPI error is 
+      the largest relative error of the KPIs that are above floor in the reference."""
+   if profiles is None: 
+      profiles = {name: {'profile': name} for name in explore.solver_profiles} 
+   explore.simu(simulationTime, plot=False, cache=False, options=dict(explore.opts_std, profile='reference'),
+                diagrams=[signal])
+   reference = explore.sim_res
+   kpi_reference = explore.pooling_kpi(reference)
+   kpis = [k for k in kpi_reference if np.isfinite(kpi_reference[k]) and abs(float(kpi_reference[k])) > floor]
+   peak_reference = np.max(np.abs(reference[signal]))
+   print()
+   print(f'Solver profiles - relative error against reference of the KPIs {", ".join(kpis)} and of {signal}')
+   print(f'relative to its peak, over {simulationTime} min')
+   for name, profile in profiles.items():
+      options = dict(explore.opts_std, **profile)
+      try:
+         times = timeit(lambda: explore.simu(simulationTime, plot=False, cache=False, options=options, 
+                                             diagrams=[signal]), repeat)
+      except Exception as e:
+         print(f'{"profile=" + name:<40s} failed: {str(e)[:60]}')
+         continue
+      sim_res = explore.sim_res
+      kpi = explore.pooling_kpi(sim_res)
+      kpi_error = max((abs(float(kpi[k])/float(kpi_reference[k]) - 1) for k in kpis), default=np.nan)
+      peak = np.interp(reference['time'], sim_res['time'], sim_res[signal])
+      peak_error = np.max(np.abs(peak - reference[signal]))/peak_reference if peak_reference > 0 else np.nan
+      report(f'profile={name}', times)
+      print(f'{"":<40s} steps {explore.engine.solver_statistics.get("steps", 0):6d}   '
+            f'KPI error {kpi_error:.2e}   peak error {peak_error:.2e}')
+
+#------------------------------------------------------------------------------------------------------------------
+#  Suite for regressions - all results are wall-clock times in s, lower is better
+#------------------------------------------------------------------------------------------------------------------
+
+def environment():
+   """System information from system_info() as dictionary together with the machine"""
+   buffer = io.StringIO()
+   with contextlib.redirect_stdout(buffer): explore.system_info()
+   info = {}
+   for line in buffer.getvalue().splitlines():
+      if line.startswith(' -') and ':' in line:
+         key, value = line[2:].split(':', 1)
+         info[key.strip()] = value.strip()
+   info.update({'Machine': platform.machine(), 'Processor': platform.processor(), 'CPUs': os.cpu_count(),
+                'NumPy': np.__version__, 'Date': time.strftime('%Y-%m-%d %H:%M:%S')})
+   return info
+
+def record(results, name, times, per=1):
+   """Put median and min of times divided by per, e.g. the number of calls, in results and report"""
+   times = np.asarray(times)/per
+   results[name] = {'median': float(np.median(times)), 'min': float(np.min(times)), 'repeat': len(times)}
+   report(name, times)
+
+def quiet(function):
+   """Function that calls function with the printout suppressed"""
+   def call():
+      with contextlib.redirect_stdout(io.StringIO()): function()
+   return call
+
+def benchmark_suite(repeat=5, NCPs=[100, 500, 2000], simulationTimes=[10.0, 100.0, 500.0], lookups=200, 
+                    workers=None, runs=None):
+   """Run the hot paths of the explore framework and return dictionary with 'environment' and 
+      'results' of median and min time for each case:
+         import of BPL_IEC_fmpy_explore and BPL_IEC_explore in a fresh interpreter,
+         simu() 'init' and 'cont' for the NCPs and simulationTimes,
+         model_get(), disp() and describe() per call,
+         newplot() and simu() for every plotType rendered by the Agg backend of matplotlib,
+         simu_batch() per run for 1, 2, 4 ... workers up to workers, default the number of CPUs.
+      Cases that fail, e.g. import of BPL_IEC_explore without PyFMI, are listed in 'failed'."""
+   import matplotlib
+   matplotlib.use('Agg')
+   results = {}
+   failed = {}
+   if workers is None: workers = os.cpu_count()
+   if runs is None: runs = 2*workers
+   print()
+   print('Suite of the hot paths')
+
+   # Import time in a fresh interpreter
+   for module in ['BPL_IEC_fmpy_explore', 'BPL_IEC_explore']:
+      script = f"import time; tic = time.perf_counter(); import {module}; print(time.perf_counter() - tic)"
+      times = []
+      for k in range(repeat):
+         process = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True)
+         if process.returncode != 0: break
+         times.append(float(process.stdout.split('\n')[-2]))
+      if times:
+         record(results, f'import {module}', times)
+      else:
+         failed[f'import {module}'] = process.stderr.strip().split('\n')[-1]
+
+   # Simulation in mode 'init' and 'cont'
+   parDict_saved = explore.parDict.copy()
+   for NCP in NCPs:
+      options = dict(explore.opts_std, NCP=NCP)
+      for simulationTime in simulationTimes:
+         record(results, f'simu init NCP={NCP} simulationTime={simulationTime}',
+                timeit(lambda: explore.simu(simulationTime, plot=False, cache=False, options=options), repeat))
+         record(results, f'simu cont NCP={NCP} simulationTime={simulationTime}',
+                timeit(lambda: explore.simu(simulationTime, 'cont', plot=False, cache=False, options=options), repeat))
+
+   # Lookup latency per call
+   explore.simu(plot=False, cache=False)
+   key = 'LFR'
+   record(results, 'model_get', timeit(lambda: [explore.model_get(explore.parLocation[key]) for k in range(lookups)],
+                                      repeat), lookups)
+   record(results, 'disp', timeit(quiet(lambda: [explore.disp(key) for k in range(lookups)]), repeat), lookups)
+   record(results, 'describe', timeit(quiet(lambda: [explore.describe(key) for k in range(lookups)]), repeat), lookups)
+
+   # Every plotType of newplot() rendered headless, the simulation itself from the cache
+   diagrams_saved = list(explore.diagrams)
+   for plotType in re.findall(r"plotType == '([^']+)'", inspect.getsource(explore.newplot)):
+      def render():
+         explore.newplot(plotType=plotType)
+         explore.simu(plot=True)
+         explore.plt.gcf().canvas.draw()
+         explore.plt.close('all')
+      try:
+         quiet(render)()
+      except Exception as e:
+         explore.plt.close('all')
+         failed[f'newplot {plotType}'] = f'{type(e).__name__}: {e}'
+         continue
+      record(results, f'newplot {plotType}', timeit(quiet(render), repeat))
+   explore.diagrams[:] = diagrams_saved
+
+   # Batch throughput as time per run, the pool started before the timing
+   LFR = explore.parDict['LFR']
+   n = 1
+   while n <= workers:
+      parDicts = [{'LFR': LFR*(1 + 0.01*k/runs)} for k in range(runs)]
+      explore.simu_batch(parDicts[:n], outputs=explore.kpi_variables, workers=n, cache=False)
+      record(results, f'simu_batch workers={n}', 
+             timeit(lambda: explore.simu_batch(parDicts, outputs=explore.kpi_variables, workers=n, cache=False), 
+                    max(1, repeat//2)), runs)
+      n = 2*n if 2*n <= workers or n == workers else workers
+   explore.parDict.update(parDict_saved)
+
+   for name, message in failed.items(): print(f'{name:<40s} failed: {message[:60]}')
+   return {'environment': environment(), 'results': results, 'failed': failed}
+
+def compare(suite, baseline, threshold=0.25, thresholds={}):
+   """Compare the median of each case of suite with baseline, both from benchmark_suite(). A case 
+      is a regression if the median is more than 1 + threshold times the baseline, where thresholds 
+      can give another threshold for cases starting with a name, e.g. {'import': 0.5}. Returns list 
+      of the cases that are regressions."""
+   regressions = []
+   print()
+   print('Suite compared to baseline of ' + baseline['environment'].get('Date', ''))
+   for key in ['Machine', 'CPUs', 'Python', 'FMPy', 'NumPy']:
+      if suite['environment'].get(key) != baseline['environment'].get(key):
+         print(f'{"note - " + key + " differs":<40s} {baseline["environment"].get(key)} -> {suite["environment"].get(key)}')
+   for name, result in suite['results'].items():
+      if name not in baseline['results']: continue
+      prefixes = [prefix for prefix in thresholds if name.startswith(prefix)]
+      limit = thresholds[max(prefixes, key=len)] if prefixes else threshold
+      ratio = result['median']/baseline['results'][name]['median']
+      flag = 'REGRESSION' if ratio > 1 + limit else ''
+      if flag: regressions.append(name)
+      print(f'{name:<40s} {1000*baseline["results"][name]["median"]:10.3f} ms -> {1000*result["median"]:10.3f} ms'
+            f'   {100*(ratio - 1):+7.1f} %   {flag}')
+   print(f'{len(regressions)} regressions')
+   return regressions
+
+#------------------------------------------------------------------------------------------------------------------
+#  Checks - consistency of the framework against the FMU over a full cycle, AssertionError beyond tolerance
+#------------------------------------------------------------------------------------------------------------------
+
+def check_pooling_replay(tolerance=0.01, simulationTime=cycleTime):
+   """pooling_replay() of the default run against new FMU simulations of the pooling at the default 
+      point and for other time windows and UV levels, relative difference of P and A harvested. All 
+      points harvest both P and A, those with UV levels where UV crosses them in the coarse part of 
+      the 'phase' grid."""
+   points = [(None, None, None, None), (None, None, 250, 600), (None, None, 350, 700), 
+             (0.012, 0.004, 0, 1000), (0.01, 0.005, 0, 1000), (0.014, 0.012, 0, 1500)]
+   print()
+   print(f'Check - pooling_replay() against the FMU, tolerance {100*tolerance} %')
+   differences = explore.pooling_replay_check(points, simulationTime=simulationTime)
+   assert not np.any(np.isnan(differences)), 'a point of the check harvests nothing in the FMU'
+   assert np.all(differences < tolerance), f'pooling_replay() differs {100*np.max(differences):.2f} % from the FMU'
+   print(f'{"largest difference":<40s} {100*np.max(differences):.3f} %')
+
+def check_column_model(tolerance=0.01, simulationTime=cycleTime, times=[100.0, cycleTime]):
+   """column_simulate() with 8 sections against the FMU for all concentrations of all sections up 
+      to each of times, largest difference relative to the peak of each concentration"""
+   names = [f'column.column_section[{j}].c[{i}]' for j in range(1, 9) for i in range(1, 6)]
+   explore.simu(simulationTime, plot=False, cache=False, diagrams=names)
+   fmu_res = explore.sim_res
+   column_res = explore.column_simulate(fmu_res, 8)
+   print()
+   print(f'Check - ColumnModel against the FMU, tolerance {100*tolerance} % of peak')
+   for t in times:
+      rows = fmu_res['time'] <= t
+      differences = [np.max(np.abs(column_res[name][rows] - fmu_res[name][rows]))/np.max(np.abs(fmu_res[name][rows]))
+                     for name in names if np.max(np.abs(fmu_res[name][rows])) > 0]
+      assert np.max(differences) < tolerance, f'ColumnModel differs {100*np.max(differences):.2f} % of peak at t={t}'
+      print(f'{"largest difference up to t=" + str(t):<40s} {100*np.max(differences):.3f} %')
+
+def check_column_ensemble(tolerance=0.01, members=3, simulationTime=cycleTime):
+   """column_ensemble() over k1..k4 against FMU simulations of each member, largest difference of 
+      the outlet concentrations relative to their peak"""
+   explore.simu(simulationTime, plot=False, cache=False)
+   fmu_res = explore.sim_res
+   rng = np.random.default_rng(1)
+   ensemble = {k: explore.parDict[k]*rng.lognormal(0, 0.1, members) for k in ['k1', 'k2', 'k3', 'k4']}
+   time_ensemble, names, y = explore.column_ensemble(ensemble, fmu_res)
+   parDict_saved = explore.parDict.copy()
+   differences = []
+   try:
+      for member in range(members):
+         explore.parDict.update({k: v[member] for k, v in ensemble.items()})
+         explore.simu(simulationTime, plot=False, cache=False, diagrams=names)
+         for k, name in enumerate(names):
+            c = np.interp(time_ensemble, explore.sim_res['time'], explore.sim_res[name])
+            if np.max(np.abs(c)) > 0: differences.append(np.max(np.abs(y[member, :, k] - c))/np.max(np.abs(c)))
+   finally:
+      explore.parDict.update(parDict_saved)
+   print()
+   print(f'Check - column_ensemble() against the FMU for {members} members, tolerance {100*tolerance} % of peak')
+   assert np.max(differences) < tolerance, f'column_ensemble() differs {100*np.max(differences):.2f} % of peak'
+   print(f'{"largest difference":<40s} {100*np.max(differences):.3f} %')
+
+def checks():
+   check_pooling_replay()
+   check_column_model()
+   check_column_ensemble()
+
+#------------------------------------------------------------------------------------------------------------------
+#  Startup
+#------------------------------------------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+   parser = argparse.ArgumentParser(description='Benchmarks of BPL_IEC_fmpy_explore.py')
+   parser.add_argument('--suite', action='store_true', help='run the suite for regressions only')
+   parser.add_argument('--check', action='store_true', help='run the checks against the FMU only')
+   parser.add_argument('--output', help='JSON file for the results of the suite')
+   parser.add_argument('--baseline', help='JSON file of an earlier suite to compare with')
+   parser.add_argument('--threshold', type=float, default=0.25, help='allowed relative increase of the median')
+   parser.add_argument('--case-threshold', action='append', default=[], metavar='CASE=THRESHOLD',
+                       help='threshold for cases starting with CASE, e.g. import=0.5')
+   parser.add_argument('--repeat', type=int, default=5)
+   args = parser.parse_args()
+
+   if args.check:
+      checks()
+   elif not args.suite:
+      checks()
+      benchmark_engine()
+      benchmark_startup()
+      benchmark_first_simulation()
+      benchmark_column_backend()
+      benchmark_ensemble()
+      benchmark_jacobian()
+      benchmark_profiles()
+   else:
+      suite = benchmark_suite(repeat=args.repeat)
+      if args.output:
+         with open(args.output, 'w') as f: json.dump(suite, f, indent=1)
+      if args.baseline:
+         with open(args.baseline) as f: baseline = json.load(f)
+         thresholds = {case: float(value) for case, value in (item.rsplit('=', 1) for item in args.case_threshold)}
+         if compare(suite, baseline, args.threshold, thresholds): sys.exit(1)
@@ -54,6 +54,30 @@
 # 2023-05-31 - Adjusted to from importlib.meetadata import version
 # 2023-06-02 - Add logging of a few variables
 # 2023-09-13 - Updated to FMU-explore 0.9.8 and introduced proces diagram
+# 2026-10-17 - Introduced FMUEngine that keeps the FMU extracted and instantiated between simulations
+# 2026-10-17 - Added simu_batch() that runs many parDicts over a process pool with a warm FMU per worker
+# 2026-10-17 - Added SimulationCache with memory LRU and on-disk store used by simu() and simu_batch()
+# 2026-10-17 - Indexed variable registry with exact names used by model_get(), disp() and describe()
+# 2026-10-17 - Added column_profiles() with array (time, section, species) and used for 'Loading' diagrams
+# 2026-10-17 - Headless mode with simu(plot=False) and import of matplotlib deferred to first diagram
+# 2026-10-17 - Model metadata cached in sidecar files keyed by the FMU hash and parsed only when changed
+# 2026-10-17 - Added snapshot() and restore() with FMU state for 'cont' and registry based _0 mapping as fallback
+# 2026-10-17 - Added campaign() that runs many chromatography cycles back to back with per-cycle KPIs
+# 2026-10-17 - Output grid planned from the phases with dense sampling only where the signals move
+# 2026-10-17 - Added ResultStore with one memory-mapped file per variable appended by simu() and campaign()
+# 2026-10-17 - Added pooling_kpi() for yield, purity, productivity and buffer use vectorized over runs
+# 2026-10-17 - Added pooling_replay() of the UV and time window pooling logic on a recorded outlet
+# 2026-10-17 - Added doe() with factorial, Latin hypercube and Sobol designs checked against parCheck
+# 2026-10-17 - Requirements in parCheck compiled once and checked for a parDict or arrays without eval()
+# 2026-10-17 - Added KPISurrogate, a Gaussian process of the KPIs used by simu(backend='surrogate')
+# 2026-10-17 - Added sensitivity() with Sobol indices from Saltelli sampling and Morris elementary effects
+# 2026-10-17 - Added estimate() of parameters against measured chromatograms with parallel multi-start
+# 2026-10-17 - Added ColumnModel in NumPy/SciPy with any number of sections used by simu(backend='numpy')
+# 2026-10-17 - Added column_ensemble() that simulates many parameter sets of ColumnModel as one system
+# 2026-10-17 - CVode of the ME FMU uses a Jacobian by coloured finite differences from the model structure
+# 2026-10-17 - Solver profiles 'screening', 'standard' and 'reference' selected with options 'profile'
+# 2026-10-17 - Timing of the phases of a simulation with simu(profile=True) and percentiles over batch runs
+# 2026-10-17 - Count and time of the FMI calls per function with simu(fmi_calls=True) and in simu_batch()
 #------------------------------------------------------------------------------------------------------------------
 
 #------------------------------------------------------------------------------------------------------------------
@@ -62,20 +86,56 @@
 
 # Setup framework
 import sys
+import os
+import shutil
+import atexit
+import hashlib
+import ast
+import operator
+import json
+import pickle
+import zlib
+import tempfile
 import platform
 import locale
+import multiprocessing
+import concurrent.futures
+import importlib
+import ctypes
 import numpy as np 
-import matplotlib.pyplot as plt 
-import matplotlib.image as img
 import zipfile 
 
+from collections import OrderedDict
+from collections import namedtuple
 from fmpy import simulate_fmu
 from fmpy import read_model_description
 import fmpy as fmpy
 
 from itertools import cycle
+from time import perf_counter
 from importlib.metadata import version 
 
+# Matplotlib is imported first when a diagram is made
+class LazyModule:
+   """Stand-in for a module that is imported at the first attribute access"""
+   def __init__(self, name):
+      self.__dict__['_name'] = name
+   def __getattr__(self, attr):
+      return getattr(importlib.import_module(self._name), attr)
+   def __setattr__(self, attr, value):
+      setattr(importlib.import_module(self._name), attr, value)
+
+plt = LazyModule('matplotlib.pyplot')
+img = LazyModule('matplotlib.image')
+
+# Scipy is only needed for Sobol designs in doe() and the column in ColumnModel
+qmc = LazyModule('scipy.stats.qmc')
+integrate = LazyModule('scipy.integrate')
+sparse = LazyModule('scipy.sparse')
+
+# The CVode solver of FMPy is only loaded when an ME FMU is simulated
+sundials = LazyModule('fmpy.sundials')
+
 # Set the environment - for Linux a JSON-file in the FMU is read
 if platform.system() == 'Linux': locale.setlocale(locale.LC_ALL, 'en_US.UTF-8')
 
@@ -88,7 +148,6 @@ global fmu_model
 if platform.system() == 'Windows':
    print('Windows - run FMU pre-compiled JModelica 2.14')
    fmu_model ='BPL_IEC_Column_system_windows_jm_cs.fmu'       
-   model_description = read_model_description(fmu_model)  
    flag_vendor = 'JM'
    flag_type = 'CS'
 elif platform.system() == 'Linux': 
@@ -97,29 +156,33 @@ elif platform.system() == 'Linux':
    if flag_vendor in ['','JM','jm']:    
       print('Linux - run FMU pre-compiled JModelica 2.4')
       fmu_model ='BPL_IEC_Column_system_linux_jm_cs.fmu'      
-      model_description = read_model_description(fmu_model) 
    if flag_vendor in ['OM','om']:
       print('Linux - run FMU pre-compiled OpenModelica') 
       if flag_type in ['CS','cs']:         
          fmu_model ='BPL_IEC_Column_system_linux_om_cs.fmu'    
-         model_description = read_model_description(fmu_model) 
       if flag_type in ['ME','me']:         
          fmu_model ='BPL_IEC_Column_system_linux_om_me.fmu' 
-         model_description = read_model_description(fmu_model) 
    else:    
       print('There is no FMU for this platform')
 
 # Provide various opts-profiles
 if flag_type in ['CS', 'cs']:
-   opts_std = {'NCP': 500}
+   opts_std = {'NCP': 500, 'grid': 'phase', 'coarse': 10, 'profile': 'standard'}
 elif flag_type in ['ME', 'me']:
-   opts_std = {'NCP': 500}
+   opts_std = {'NCP': 500, 'grid': 'phase', 'coarse': 10, 'profile': 'standard'}
 else:    
    print('There is no FMU for this platform')
 
+# Solver profiles selected with options 'profile', see solver_settings(). The relative tolerance None 
+# is the default experiment tolerance of the FMU and max step [min] None is the FMPy default of 1/50 of 
+# the simulation time. For a CS FMU only the relative tolerance is used.
+solver_profiles = {'screening': {'solver': 'CVode', 'relative_tolerance': 1e-3, 'max_step': None},
+                   'standard': {'solver': 'CVode', 'relative_tolerance': None, 'max_step': None},
+                   'reference': {'solver': 'CVode', 'relative_tolerance': 1e-9, 'max_step': 1.0}}
+
 # Provide various MSL and BPL versions
 if flag_vendor in ['JM', 'jm']:
-   constants = [v for v in model_description.modelVariables if v.causality == 'local'] 
+   constants = [v for v in read_model_description(fmu_model).modelVariables if v.causality == 'local'] 
    MSL_usage = [x[1] for x in [(constants[k].name, constants[k].start) \
                      for k in range(len(constants))] if 'MSL.usage' in x[0]][0]   
    MSL_version = [x[1] for x in [(constants[k].name, constants[k].start) \
@@ -135,6 +198,10 @@ else:
 
 # Simulation time
 global simulationTime; simulationTime = 100.0
+
+# Simulation time of a full cycle with the default parDict, past all switch points and the pooling,
+# used by default where the KPIs of the pooling are needed
+global cycleTime; cycleTime = 1500.0
 global prevFinalTime; prevFinalTime = 0
 
 # Provide process diagram on disk
@@ -151,33 +218,10 @@ component_list_minimum = []
 #------------------------------------------------------------------------------------------------------------------
    
 # Create stateDict that later will be used to store final state and used for initialization in 'cont':
+# - filled by states_setup() from the model metadata, see general code below
 global stateDict; stateDict =  {}
-stateDict = {variable.derivative.name:None for variable in model_description.modelVariables \
-                                            if variable.derivative is not None}
-stateDict.update(timeDiscreteStates) 
-
 global stateDictInitial; stateDictInitial = {}
-for key in stateDict.keys():
-    if not key[-1] == ']':
-         if key[-3:] == 'I.y':
-            stateDictInitial[key] = key[:-10]+'I_0'
-         elif key[-3:] == 'D.x':
-            stateDictInitial[key] = key[:-10]+'D_0'
-         else:
-            stateDictInitial[key] = key+'_0'
-    elif key[-3] == '[':
-        stateDictInitial[key] = key[:-3]+'_0'+key[-3:]
-    elif key[-4] == '[':
-        stateDictInitial[key] = key[:-4]+'_0'+key[-4:]
-    elif key[-5] == '[':
-        stateDictInitial[key] = key[:-5]+'_0'+key[-5:] 
-    else:
-        print('The state vector has more than 1000 states')
-        break
-
 global stateDictInitialLoc; stateDictInitialLoc = {}
-for value in stateDictInitial.values():
-    stateDictInitialLoc[value] = value
 
 # Create dictionaries parDict and parLocation
 global parDict; parDict = {}
@@ -266,6 +310,23 @@ key_variables.append(parLocation['tank_mixing.outlet.c[1]'])
 parLocation['control_buffer2.scaling'] ='control_buffer2.scaling'; 
 key_variables.append(parLocation['control_buffer2.scaling'])
 
+# Scale factor of the switch points always recorded so that pooling_replay() uses the one of the result
+key_variables.append('scaling')
+
+# Pumped liquid volume always recorded for lookup of column profiles by volume
+key_variables.append('ackF')
+
+# Inlet of the column always recorded so that ColumnModel can be driven by it - as the flows from the 
+# sources mixed in tank_mixing, which change at the events where the recorded concentration of 
+# tank_mixing still lags, and column.inlet.c is no help being the stream value for reversed flow
+global inlet_sources; inlet_sources = ['tank_sample', 'tank_buffer1', 'tank_buffer2']
+global inlet_variables; inlet_variables = [source + '.outlet.F' for source in inlet_sources]
+key_variables.extend(inlet_variables)
+
+# Components after the column that ColumnModel does not describe
+global column_downstream; column_downstream = ['uv_detector', 'conductivity_detector', 'control_pooling', 
+                                               'tank_harvest', 'tank_waste']
+
 # Parameter value check - especially for hysteresis to avoid runtime error
 global parCheck; parCheck = []
 parCheck.append("parDict['start_adsorption'] < parDict['stop_adsorption']")
@@ -273,18 +334,169 @@ parCheck.append("parDict['start_desorption'] < parDict['stationary_desorption']"
 parCheck.append("parDict['stationary_desorption'] < parDict['stop_desorption']")
 parCheck.append("parDict['start_uv'] > parDict['stop_uv']")
 
+# Schedules of a chromatography cycle - the tables start at the beginning of each cycle in campaign()
+global cycle_schedules; cycle_schedules = []
+cycle_schedules.append('control_sample.loading.startTime')
+cycle_schedules.append('control_desorption_buffer.step_table.startTime')
+cycle_schedules.append('control_desorption_buffer.gradient_table.startTime')
+cycle_schedules.append('control_pooling.loading.startTime')
+
+# KPIs of pooling from the recorded variables at the start and the end of a run
+global kpi_variables; kpi_variables = []
+kpi_variables.append('tank_harvest.m[1]')
+kpi_variables.append('tank_harvest.m[2]')
+kpi_variables.append('tank_harvest.V')
+kpi_variables.append('tank_sample.V')
+kpi_variables.append('tank_buffer1.V')
+kpi_variables.append('tank_buffer2.V')
+kpi_variables.append('column.V')
+
+def pooling_kpi(res, P_in=None):
+   """KPIs of pooling for a result with the kpi_variables, eg sim_res (time) or the result of 
+      simu_batch(outputs=kpi_variables) (run x time), where runs padded with nan are handled.
+      Returns a dictionary of arrays with one value per run:
+       - P_harvest, A_harvest, V_harvest - product, antagonist [mg] and volume [mL] harvested
+       - purity - P_harvest/(P_harvest + A_harvest)
+       - yield - P_harvest relative to the product loaded from tank_sample with concentration P_in
+       - productivity - P_harvest per column volume and minute [mg/mL/min]
+       - buffer - buffer used from tank_buffer1 and tank_buffer2 [mL]
+      P_in is by default taken from the parDict of each run or else the current parDict."""
+   names = res.dtype.names if hasattr(res, 'dtype') else res.keys()
+   missing = [name for name in kpi_variables + ['time'] if name not in names]
+   if missing: raise ValueError('Variables not recorded: ' + ', '.join(missing))
+
+   def first_last(name):
+      x = np.asarray(res[name], dtype=float)
+      n = np.maximum(np.sum(~np.isnan(x), axis=-1) - 1, 0)
+      return x[..., 0], np.take_along_axis(x, np.expand_dims(n, -1), axis=-1)[..., 0]
+
+   change = {}
+   for name in kpi_variables + ['time']:
+      first, last = first_last(name)
+      change[name] = last - first
+   if P_in is None:
+      P_in = np.array([x['P_in'] for x in res['parDict']]) if 'parDict' in names else parDict['P_in']
+   P = change['tank_harvest.m[1]']
+   A = change['tank_harvest.m[2]']
+   with np.errstate(divide='ignore', invalid='ignore'):
+      kpi = {'P_harvest': P, 'A_harvest': A, 'V_harvest': change['tank_harvest.V'],
+             'purity': np.where(P + A > 0, P/(P + A), np.nan),
+             'yield': P/(-change['tank_sample.V']*P_in),
+             'productivity': P/(first_last('column.V')[1]*change['time']),
+             'buffer': -(change['tank_buffer1.V'] + change['tank_buffer2.V'])}
+   return kpi
+
+# KPIs of a cycle in campaign() from the recorded rows at the start and the end of the cycle
+global cycle_variables; cycle_variables = kpi_variables
+
+def cycle_kpi(first, last):
+   return {key: value.item() for key, value in pooling_kpi(np.stack([first, last])).items()}
+
+# KPIs of simulations from mode 'init' as (parDict, simulationTime, kpi) collected for KPISurrogate, 
+# one per parDict and simulationTime and at most kpi_observations_max with the oldest dropped first
+global kpi_observations; kpi_observations = OrderedDict()
+global kpi_observations_max; kpi_observations_max = 4096
+global kpi_observations_added; kpi_observations_added = 0
+
+def record_kpi(parDicts, simulationTime, kpi):
+   """Add observations for a list of parDicts and pooling_kpi() with one value per parDict, 
+      replacing earlier observations of the same parDict and simulationTime"""
+   global kpi_observations_added
+   for index, parDict_run in enumerate(parDicts):
+      key = (tuple(sorted(parDict_run.items())), simulationTime)
+      kpi_observations.pop(key, None)
+      kpi_observations[key] = (dict(parDict_run), simulationTime, {k: float(np.ravel(v)[index]) for k, v in kpi.items()})
+      kpi_observations_added += 1
+   while len(kpi_observations) > kpi_observations_max: kpi_observations.popitem(last=False)
+
+# Phases of a cycle where the signals move and output_grid() samples densely - a phase is given
+# by the parameters of its start and stop and a single switch point by the same parameter twice
+global grid_phases; grid_phases = []
+grid_phases.append(('start_adsorption', 'stop_adsorption'))
+grid_phases.append(('start_desorption', 'stop_desorption'))
+grid_phases.append(('start_pooling', 'start_pooling'))
+grid_phases.append(('stop_pooling', 'stop_pooling'))
 
 # Create list of diagrams to be plotted by simu()
 global diagrams
 diagrams = []
 
+# Column profiles of recorded concentrations in the sections
+class ColumnProfiles:
+   """Concentrations of the column sections in sim_res as array c with shape (time, section, species). 
+      The array is a read-only view into sim_res when the fields are stored regularly, otherwise a copy. 
+      Profiles can be looked up by time, pumped liquid volume ackF [mL] or column volumes [CV]."""
+
+   def __init__(self, sim_res, name='column.column_section[{section}].c[{species}]'):
+      fields = sim_res.dtype.fields
+      sections = 0
+      while name.format(section=sections+1, species=1) in fields: sections += 1
+      species = 0
+      while name.format(section=1, species=species+1) in fields: species += 1
+      names = [[name.format(section=j, species=i) for i in range(1, species+1)] for j in range(1, sections+1)]
+      
+      self.time = sim_res['time']
+      self.ackF = sim_res['ackF'] if 'ackF' in fields else None
+      self.V = sim_res['column.V'][-1] if 'column.V' in fields else None
+      self.c = self.view(sim_res, names)
+      if self.c is None:
+         self.c = np.stack([np.stack([sim_res[n] for n in row], axis=-1) for row in names], axis=1)
+
+   @staticmethod
+   def view(sim_res, names):
+      """Return array (time, section, species) sharing memory with sim_res or None if not possible"""
+      fields = sim_res.dtype.fields
+      if not isinstance(sim_res, np.ndarray) or not sim_res.flags['C_CONTIGUOUS']: return None
+      if len(names) < 2 or len(names[0]) < 2: return None
+      if any(fields[n][0] != np.float64 for row in names for n in row): return None
+      offsets = np.array([[fields[n][1] for n in row] for row in names])
+      offset, stride_section, stride_species = offsets[0,0], offsets[1,0]-offsets[0,0], offsets[0,1]-offsets[0,0]
+      sections, species = offsets.shape
+      regular = offset + stride_section*np.arange(sections)[:,None] + stride_species*np.arange(species)[None,:]
+      if not np.array_equal(offsets, regular): return None
+      c = np.ndarray(shape=(len(sim_res), sections, species), dtype=np.float64, buffer=sim_res, offset=offset, 
+                     strides=(sim_res.strides[0], stride_section, stride_species))
+      c.flags.writeable = False
+      return c
+
+   def index(self, axis, values):
+      """Index of first sample at or after values on the given increasing axis"""
+      return np.clip(np.searchsorted(axis, values), 0, len(axis)-1)
+
+   def at_time(self, t):
+      """Profiles at time t [min] - scalar gives (section, species) and array gives (n, section, species)"""
+      return self.c[self.index(self.time, t)]
+
+   def at_volume(self, V):
+      """Profiles at pumped liquid volume ackF [mL]"""
+      if self.ackF is None: raise ValueError('Variable ackF not logged')
+      return self.c[self.index(self.ackF, V)]
+
+   def at_cv(self, CV):
+      """Profiles at pumped liquid volume in column volumes [CV]"""
+      if self.V is None: raise ValueError('Variable column.V not logged')
+      return self.at_volume(np.asarray(CV)*self.V)
+
+def column_profiles(sim_res=None):
+   """Return ColumnProfiles of sim_res, by default from the last simulation"""
+   if sim_res is None: sim_res = globals()['sim_res']
+   return ColumnProfiles(sim_res)
+
+# Fraction of simulation time for profiles in 'Loading' diagrams
+loading_fractions = [0.02, 0.1, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0]
+
+def loading_profiles(id, fractions=None, sim_res=None):
+   """Profiles of species id for fractions of the simulation time as array (section, fraction),
+      by default from the last simulation"""
+   if fractions is None: fractions = loading_fractions
+   profiles = column_profiles(sim_res)
+   return profiles.at_time(profiles.time[0] + np.asarray(fractions)*(profiles.time[-1]-profiles.time[0]))[:, :, id-1].T
+
 # Define standard plots
-def profile(t_n, id):
-    data = np.zeros(9)
-    data[0] = sim_res['time'][t_n]
-    for j in list(range(1,9)):
-        data[j] = sim_res['column.column_section[' + str(j) + '].c[' + str(id) + ']'][t_n]
-    return data
+def profile(t_n, id, sim_res=None):
+   """Time and profile of species id at sample t_n of sim_res as array (1 + section)"""
+   profiles = column_profiles(sim_res)
+   return np.concatenate(([profiles.time[t_n]], profiles.c[t_n, :, id-1]))
 
 def newplot(title='IEC', plotType='Loading'):
    """ Standard plot window 
@@ -315,28 +527,10 @@ def newplot(title='IEC', plotType='Loading'):
       
       # Part of plot made after simulation
       diagrams.clear()
-      diagrams.append("ax1.plot(list(range(1,9)), profile(10,4)[1:], color='b', linestyle=linetype)")
-      diagrams.append("ax1.plot(list(range(1,9)), profile(50,4)[1:], 'b')")
-      diagrams.append("ax1.plot(list(range(1,9)), profile(150,4)[1:], 'b')")
-      diagrams.append("ax1.plot(list(range(1,9)), profile(200,4)[1:], 'b')")
-      diagrams.append("ax1.plot(list(range(1,9)), profile(250,4)[1:], 'b')")
-      diagrams.append("ax1.plot(list(range(1,9)), profile(300,4)[1:], 'b')")
-      diagrams.append("ax1.plot(list(range(1,9)), profile(350,4)[1:], 'b')")
-      diagrams.append("ax1.plot(list(range(1,9)), profile(400,4)[1:], 'b')")
-      diagrams.append("ax1.plot(list(range(1,9)), profile(450,4)[1:], 'b')")
-      diagrams.append("ax1.plot(list(range(1,9)), profile(500,4)[1:], 'b')")
-      diagrams.append("ax1.plot(list(range(1,9)), profile(10,5)[1:], 'r')")
-      diagrams.append("ax1.plot(list(range(1,9)), profile(50,5)[1:], 'r')")
-      diagrams.append("ax1.plot(list(range(1,9)), profile(150,5)[1:], 'r')")
-      diagrams.append("ax1.plot(list(range(1,9)), profile(200,5)[1:], 'r')")
-      diagrams.append("ax1.plot(list(range(1,9)), profile(250,5)[1:], 'r')")
-      diagrams.append("ax1.plot(list(range(1,9)), profile(300,5)[1:], 'r')")
-      diagrams.append("ax1.plot(list(range(1,9)), profile(350,5)[1:], 'r')")
-      diagrams.append("ax1.plot(list(range(1,9)), profile(400,5)[1:], 'r')")
-      diagrams.append("ax1.plot(list(range(1,9)), profile(450,5)[1:], 'r')")
-      diagrams.append("ax1.plot(list(range(1,9)), profile(500,5)[1:], 'r')")
-      diagrams.append("ax2.plot(list(range(1,9)), profile(500,4)[1:], 'b*-')")      
-      diagrams.append("ax2.plot(list(range(1,9)), profile(500,5)[1:], 'r*-')")      
+      diagrams.append("ax1.plot(list(range(1,9)), loading_profiles(4, sim_res=sim_res), color='b', linestyle=linetype)")
+      diagrams.append("ax1.plot(list(range(1,9)), loading_profiles(5, sim_res=sim_res), color='r', linestyle=linetype)")
+      diagrams.append("ax2.plot(list(range(1,9)), loading_profiles(4, [1.0], sim_res=sim_res), 'b*-')")      
+      diagrams.append("ax2.plot(list(range(1,9)), loading_profiles(5, [1.0], sim_res=sim_res), 'r*-')")      
         
    elif plotType == 'Loading-combined':
       
@@ -365,29 +559,11 @@ def newplot(title='IEC', plotType='Loading'):
       # Part of plot made after simulation
       diagrams.clear()    
       diagrams.append("ax11.plot(sim_res['time'], sim_res['tank_mixing.outlet.c[1]'], color='b', linestyle=linetype)")           
-      diagrams.append("ax12.plot(list(range(1,9)), profile(10,4)[1:], color='b', linestyle=linetype)")
-      diagrams.append("ax12.plot(list(range(1,9)), profile(50,4)[1:], color='b', linestyle=linetype)")
-      diagrams.append("ax12.plot(list(range(1,9)), profile(150,4)[1:], color='b', linestyle=linetype)")
-      diagrams.append("ax12.plot(list(range(1,9)), profile(200,4)[1:], color='b', linestyle=linetype)")
-      diagrams.append("ax12.plot(list(range(1,9)), profile(250,4)[1:], color='b', linestyle=linetype)")
-      diagrams.append("ax12.plot(list(range(1,9)), profile(300,4)[1:], color='b', linestyle=linetype)")
-      diagrams.append("ax12.plot(list(range(1,9)), profile(350,4)[1:], color='b', linestyle=linetype)")
-      diagrams.append("ax12.plot(list(range(1,9)), profile(400,4)[1:], color='b', linestyle=linetype)")
-      diagrams.append("ax12.plot(list(range(1,9)), profile(450,4)[1:], color='b', linestyle=linetype)")
-      diagrams.append("ax12.plot(list(range(1,9)), profile(500,4)[1:], color='b', linestyle=linetype)")
-      diagrams.append("ax12.plot(list(range(1,9)), profile(10,5)[1:], color='r', linestyle=linetype)")
-      diagrams.append("ax12.plot(list(range(1,9)), profile(50,5)[1:], color='r', linestyle=linetype)")
-      diagrams.append("ax12.plot(list(range(1,9)), profile(150,5)[1:], color='r', linestyle=linetype)")
-      diagrams.append("ax12.plot(list(range(1,9)), profile(200,5)[1:], color='r', linestyle=linetype)")
-      diagrams.append("ax12.plot(list(range(1,9)), profile(250,5)[1:], color='r', linestyle=linetype)")
-      diagrams.append("ax12.plot(list(range(1,9)), profile(300,5)[1:], color='r', linestyle=linetype)")
-      diagrams.append("ax12.plot(list(range(1,9)), profile(350,5)[1:], color='r', linestyle=linetype)")
-      diagrams.append("ax12.plot(list(range(1,9)), profile(400,5)[1:], color='r', linestyle=linetype)")
-      diagrams.append("ax12.plot(list(range(1,9)), profile(450,5)[1:], color='r', linestyle=linetype)")
-      diagrams.append("ax12.plot(list(range(1,9)), profile(500,5)[1:], color='r', linestyle=linetype)")
+      diagrams.append("ax12.plot(list(range(1,9)), loading_profiles(4, sim_res=sim_res), color='b', linestyle=linetype)")
+      diagrams.append("ax12.plot(list(range(1,9)), loading_profiles(5, sim_res=sim_res), color='r', linestyle=linetype)")
       diagrams.append("ax21.plot(sim_res['time'], sim_res['tank_waste.V'], color='b', linestyle=linetype)")
-      diagrams.append("ax22.plot(list(range(1,9)), profile(500,4)[1:], color='b', linestyle=linetype)")      
-      diagrams.append("ax22.plot(list(range(1,9)), profile(500,5)[1:], color='r', linestyle=linetype)")  
+      diagrams.append("ax22.plot(list(range(1,9)), loading_profiles(4, [1.0], sim_res=sim_res), color='b', linestyle=linetype)")      
+      diagrams.append("ax22.plot(list(range(1,9)), loading_profiles(5, [1.0], sim_res=sim_res), color='r', linestyle=linetype)")  
       
    elif plotType == 'Elution':
       
@@ -1065,6 +1241,91 @@ def describe(name, decimals=3):
 FMU_explore = 'FMU-explore for FMPy version 0.9.8'
 #------------------------------------------------------------------------------------------------------------------
 
+# Requirements in parCheck compiled to callables
+class Requirement:
+   """Requirement string from parCheck compiled once to a callable. Only comparisons, and/or/not, 
+      arithmetic, numbers and parDict['key'] are allowed. Called with a parDict or a dictionary of 
+      arrays, where keys not given are taken from the current parDict, it returns a bool or an 
+      array mask. Requirements of the form parDict['a'] < parDict['b'] have ordering (a, '<', b)."""
+
+   operators = {ast.Lt: operator.lt, ast.LtE: operator.le, ast.Gt: operator.gt, ast.GtE: operator.ge,
+                ast.Eq: operator.eq, ast.NotEq: operator.ne, ast.Add: operator.add, ast.Sub: operator.sub,
+                ast.Mult: operator.mul, ast.Div: operator.truediv, ast.USub: operator.neg}
+
+   def __init__(self, text):
+      self.text = text
+      self.keys = []
+      tree = ast.parse(text.strip(), mode='eval').body
+      self.function = self.compile(tree)
+      self.ordering = None
+      if isinstance(tree, ast.Compare) and len(tree.ops) == 1 and type(tree.ops[0]) in [ast.Lt, ast.Gt] \
+         and all(self.key(node) is not None for node in [tree.left] + tree.comparators):
+         self.ordering = (self.key(tree.left), '<' if isinstance(tree.ops[0], ast.Lt) else '>', 
+                          self.key(tree.comparators[0]))
+
+   @staticmethod
+   def key(node):
+      if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) and node.value.id == 'parDict':
+         index = node.slice if isinstance(node.slice, ast.Constant) else getattr(node.slice, 'value', None)
+         if isinstance(index, ast.Constant) and isinstance(index.value, str): return index.value
+      return None
+
+   def compile(self, node):
+      key = self.key(node)
+      if key is not None:
+         self.keys.append(key)
+         return lambda values: values[key] if key in values else parDict[key]
+      if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, bool)):
+         value = node.value
+         return lambda values: value
+      if isinstance(node, ast.Compare) and all(type(op) in self.operators for op in node.ops):
+         terms = [self.compile(x) for x in [node.left] + node.comparators]
+         ops = [self.operators[type(op)] for op in node.ops]
+         def compare(values):
+            x = [term(values) for term in terms]
+            return np.logical_and.reduce([op(x[k], x[k+1]) for k, op in enumerate(ops)])
+         return compare
+      if isinstance(node, ast.BoolOp):
+         terms = [self.compile(x) for x in node.values]
+         combine = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+         return lambda values: combine.reduce([term(values) for term in terms])
+      if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+         term = self.compile(node.operand)
+         return lambda values: np.logical_not(term(values))
+      if isinstance(node, ast.UnaryOp) and type(node.op) in self.operators:
+         term, op = self.compile(node.operand), self.operators[type(node.op)]
+         return lambda values: op(term(values))
+      if isinstance(node, ast.BinOp) and type(node.op) in self.operators:
+         left, right, op = self.compile(node.left), self.compile(node.right), self.operators[type(node.op)]
+         return lambda values: op(left(values), right(values))
+      raise ValueError('Requirement not allowed: ' + self.text)
+
+   def __call__(self, values):
+      return self.function(values)
+
+# Compiled requirements by their text, so parCheck can still be extended with strings
+global requirements; requirements = {}
+
+def requirement(text):
+   if text not in requirements: requirements[text] = Requirement(text)
+   return requirements[text]
+
+def check(values, parCheck=parCheck):
+   """Check the requirements in parCheck for a parDict or a dictionary of arrays, eg a DOE design. 
+      Returns a bool or a mask with the points where all requirements hold, and a list of the 
+      requirements that do not hold, for arrays with the number of points."""
+   n = max([np.size(v) for v in values.values() if np.ndim(v) > 0], default=None)
+   mask = True if n is None else np.ones(n, dtype=bool)
+   messages = []
+   for text in parCheck:
+      holds = requirement(text)(values)
+      mask = mask & holds
+      if n is None and not holds:
+         messages.append(text)
+      elif n is not None and not np.all(holds):
+         messages.append('{} - {} of {} points'.format(text, n - np.count_nonzero(np.broadcast_to(holds, (n,))), n))
+   return mask, messages
+
 # Define function par() for parameter update
 def par(parDict=parDict, parCheck=parCheck, parLocation=parLocation, *x, **x_kwarg):
    """ Set parameter values if available in the predefined dictionaryt parDict. """
@@ -1077,7 +1338,7 @@ def par(parDict=parDict, parCheck=parCheck, parLocation=parLocation, *x, **x_kwa
          print('Error:', key, '- seems not an accessible parameter - check the spelling')
    parDict.update(x_temp)
    
-   parErrors = [requirement for requirement in parCheck if not(eval(requirement))]
+   _, parErrors = check(parDict, parCheck)
    if not parErrors == []:
       print('Error - the following requirements do not hold:')
       for index, item in enumerate(parErrors): print(item)
@@ -1095,43 +1356,63 @@ def init(parDict=parDict, *x, **x_kwarg):
          print('Error:', key, '- seems not an initial value, use par() instead - check the spelling')
    parDict.update(x_init)
 
+# Index of the model variables by exact name, built once per FMU by FMUEngine.registry()
+VariableInfo = namedtuple('VariableInfo', ['valueReference', 'type', 'causality', 'variability', 
+                                           'start', 'unit', 'description'])
+
+def variable_registry(model_description):
+   """Return dictionary from variable name to VariableInfo for all model variables"""
+   def typed_start(type, start):
+      if start is None: return None
+      if type == 'Real': return float(start)
+      if type in ['Integer', 'Enumeration']: return int(start)
+      if type == 'Boolean': return start in ['true', '1', True]
+      return start
+   registry = {}
+   for v in model_description.modelVariables:
+      unit = v.unit
+      if unit is None and v.declaredType is not None: unit = getattr(v.declaredType, 'unit', None)
+      registry[v.name] = VariableInfo(v.valueReference, v.type, v.causality, v.variability, 
+                                      typed_start(v.type, v.start), unit, v.description)
+   return registry
+
 # Define fuctions similar to pyfmi model.get(), model.get_variable_descirption(), model.get_variable_unit()
-def model_get(parLoc, model_description=model_description):
+def model_get(parLoc, registry=None):
    """ Function corresponds to pyfmi model.get() but returns just a value and not a list"""
-   par_var = model_description.modelVariables
-   for k in range(len(par_var)):
-      if par_var[k].name == parLoc:
+   if registry is None: registry = engine.registry()
+   variable = registry.get(parLoc)
+   if variable is None:
+      print('Error:', parLoc, '- not a variable in the model')
+      return None
+   try:
+      if parLoc in start_values.keys():
+         value = start_values[parLoc]
+      elif variable.variability in ['constant']:        
+         value = variable.start                          
+      elif variable.variability in ['fixed', 'continuous']:
          try:
-            if par_var[k].name in start_values.keys():
-                  value = start_values[par_var[k].name]
-            elif par_var[k].variability in ['constant']:        
-                  value = float(par_var[k].start)                          
-            elif par_var[k].variability in ['fixed', 'continuous']:
-               try:
-                  value = sim_res[par_var[k].name][-1]
-               except (AttributeError, ValueError):
-                  value = None
-                  print('Variable not logged')
-            else:
-               value = None
-         except NameError:
-            print('Error: Information available after first simulation')
+            value = sim_res[parLoc][-1]
+         except (AttributeError, ValueError):
             value = None
+            print('Variable not logged')
+      else:
+         value = None
+   except NameError:
+      print('Error: Information available after first simulation')
+      value = None
    return value
 
-def model_get_variable_description(parLoc, model_description=model_description):
+def model_get_variable_description(parLoc, registry=None):
    """ Function corresponds to pyfmi model.get_variable_description() but returns just a value and not a list"""
-   par_var = model_description.modelVariables
-#   value = [x[1] for x in [(par_var[k].name, par_var[k].description) for k in range(len(par_var))] if parLoc in x[0]]
-   value = [x.description for x in par_var if parLoc in x.name]   
-   return value[0]
+   if registry is None: registry = engine.registry()
+   variable = registry.get(parLoc)
+   return None if variable is None else variable.description
    
-def model_get_variable_unit(parLoc, model_description=model_description):
+def model_get_variable_unit(parLoc, registry=None):
    """ Function corresponds to pyfmi model.get_variable_unit() but returns just a value and not a list"""
-   par_var = model_description.modelVariables
-#   value = [x[1] for x in [(par_var[k].name, par_var[k].unit) for k in range(len(par_var))] if parLoc in x[0]]
-   value = [x.unit for x in par_var if parLoc in x.name]
-   return value[0]
+   if registry is None: registry = engine.registry()
+   variable = registry.get(parLoc)
+   return None if variable is None else variable.unit
       
 # Define function disp() for display of initial values and parameters
 def disp(name='', decimals=3, mode='short'):
@@ -1142,38 +1423,43 @@ def disp(name='', decimals=3, mode='short'):
       seen = set()
       return {v: k for k, v in d.items() if v not in seen or seen.add(v)}
    
+   parLocation_reversed = dict_reverser(parLocation)
+
    if mode in ['short']:
       k = 0
       for Location in [parLocation[k] for k in parDict.keys()]:
          if name in Location:
-            if type(model_get(Location)) != np.bool_:
-               print(dict_reverser(parLocation)[Location] , ':', np.round(model_get(Location),decimals))
+            value = model_get(Location)
+            if not isinstance(value, (bool, np.bool_)):
+               print(parLocation_reversed[Location] , ':', np.round(value,decimals))
             else:
-               print(dict_reverser(parLocation)[Location] , ':', model_get(Location))               
+               print(parLocation_reversed[Location] , ':', value)               
          else:
             k = k+1
       if k == len(parLocation):
          for parName in parDict.keys():
             if name in parName:
-               if type(model_get(Location)) != np.bool_:
-                  print(parName,':', np.round(model_get(parLocation[parName]),decimals))
+               value = model_get(parLocation[parName])
+               if not isinstance(value, (bool, np.bool_)):
+                  print(parName,':', np.round(value,decimals))
                else: 
-                  print(parName,':', model_get(parLocation[parName])[0])
+                  print(parName,':', value)
 
    if mode in ['long','location']:
       k = 0
       for Location in [parLocation[k] for k in parDict.keys()]:
          if name in Location:
-            if type(model_get(Location)) != np.bool_:       
-               print(Location,':', dict_reverser(parLocation)[Location] , ':', np.round(model_get(Location),decimals))
+            value = model_get(Location)
+            if not isinstance(value, (bool, np.bool_)):       
+               print(Location,':', parLocation_reversed[Location] , ':', np.round(value,decimals))
          else:
             k = k+1
       if k == len(parLocation):
          for parName in parDict.keys():
             if name in parName:
-               if type(model_get(Location)) != np.bool_:
-                  print(parLocation[parName], ':', dict_reverser(parLocation)[Location], ':', parName,':', 
-                     np.round(model_get(parLocation[parName]),decimals))
+               value = model_get(parLocation[parName])
+               if not isinstance(value, (bool, np.bool_)):
+                  print(parLocation[parName], ':', parName,':', np.round(value,decimals))
 
 # Line types
 def setLines(lines=['-','--',':','-.']):
@@ -1181,33 +1467,1113 @@ def setLines(lines=['-','--',':','-.']):
    global linecycler
    linecycler = cycle(lines)
 
+setLines()
+
+# Headless use, e.g. batch and server, where simu() does not evaluate any diagrams
+global headless; headless = False
+
 # Show plots from sim_res, just that
-def show(diagrams=diagrams):
-   """Show diagrams chosen by newplot()"""
+def show(diagrams=diagrams, sim_res=None):
+   """Show diagrams chosen by newplot(), by default from the last simulation or else from sim_res
+      given as eg a ResultStore"""
+   if sim_res is None: sim_res = globals()['sim_res']
    # Plot pen
    linetype = next(linecycler)    
    # Plot diagrams 
    for command in diagrams: eval(command)
 
+# Persistent FMU instance used by simu()
+class FMUEngine:
+   """Keep the FMU extracted and instantiated between simulations. Each simulation only resets 
+      the instance, applies start_values and integrates. A fresh instance is made when the FMU 
+      file on disk has changed or the instance can not be reset. With unzipdir given the FMU 
+      extracted there by the owner, e.g. the parent of batch workers, is used and never removed."""
+
+   # Version of the content of the sidecar files, increased when model_metadata() changes
+   sidecar_format = 3
+
+   def __init__(self, fmu_model, model_description=None, unzipdir=None):
+      self.fmu_model = fmu_model
+      self.shared_unzipdir = unzipdir
+      self.model_description = model_description
+      self.model_description_hash = None if model_description is None else self.fmu_hash()
+      self.meta = None
+      self.meta_hash = None
+      self.unzipdir = None
+      self.fmu = None
+      self.fmu_signature = None
+      self.fmu_used = False
+      self.final_state = None
+      self.instantiations = 0
+      self.variables = None
+      self.jacobian = 'colored'
+      self.solver_class = None
+      self.solver_hash = None
+      self.solver_statistics = {}
+      self.timing = {}
+      self.fmi_calls = None
+      self.initial = OrderedDict()
+      self.pid = os.getpid()
+      atexit.register(self.free)
+
+   def signature(self):
+      """File identity used to detect that the FMU has changed on disk"""
+      stat = os.stat(self.fmu_model)
+      return (os.path.abspath(self.fmu_model), stat.st_size, stat.st_mtime_ns)
+
+   def fmu_hash(self):
+      """SHA-256 of the FMU file, recomputed only when the file has changed"""
+      signature = self.signature()
+      if getattr(self, 'fmu_hash_signature', None) != signature:
+         sha = hashlib.sha256()
+         with open(self.fmu_model, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''): sha.update(block)
+         self.fmu_hash_value = sha.hexdigest()
+         self.fmu_hash_signature = signature
+      return self.fmu_hash_value
+
+   def load(self):
+      """Extract and instantiate the FMU unless the current instance is still valid"""
+      signature = self.signature()
+      if self.fmu is not None and signature == self.fmu_signature:
+         return self.fmu
+      model_description = self.get_model_description()
+      self.free()
+      self.unzipdir = self.shared_unzipdir or fmpy.extract(self.fmu_model)
+      self.fmu = fmpy.instantiate_fmu(self.unzipdir, model_description)
+      self.fmu_signature = signature
+      self.fmu_used = False
+      self.instantiations += 1
+      return self.fmu
+
+   def sidecar(self, extension):
+      """Path of sidecar file with cached information for the current FMU file"""
+      directory = os.path.join(os.path.dirname(os.path.abspath(self.fmu_model)), '.fmu_explore')
+      return os.path.join(directory, os.path.basename(self.fmu_model) + '.' + self.fmu_hash()[:16] + '.' + extension)
+
+   def read_sidecar(self, extension):
+      """Return content of sidecar file or None if missing, unreadable or from another FMPy version"""
+      try:
+         with open(self.sidecar(extension), 'rb') as f:
+            content = pickle.loads(zlib.decompress(f.read()))
+      except Exception:
+         return None
+      if content.get('fmpy') != fmpy.__version__ or content.get('format') != self.sidecar_format: return None
+      return content['data']
+
+   def write_sidecar(self, extension, data):
+      """Write sidecar file atomically, silently skipped if the directory is not writable"""
+      path = self.sidecar(extension)
+      try:
+         os.makedirs(os.path.dirname(path), exist_ok=True)
+         fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+         with os.fdopen(fd, 'wb') as f:
+            f.write(zlib.compress(pickle.dumps({'fmpy': fmpy.__version__, 'format': self.sidecar_format, 'data': data}, 
+                                               protocol=pickle.HIGHEST_PROTOCOL)))
+         os.replace(tmp, path)
+      except OSError:
+         pass
+
+   def get_model_description(self):
+      """FMPy model description - from the sidecar file and parsed from the FMU only when changed"""
+      fmu_hash = self.fmu_hash()
+      if self.model_description is None or self.model_description_hash != fmu_hash:
+         model_description = self.read_sidecar('md')
+         if model_description is None:
+            model_description = read_model_description(self.fmu_model, validate=False)
+            self.write_sidecar('md', model_description)
+         self.model_description = model_description
+         self.model_description_hash = fmu_hash
+      return self.model_description
+
+   def metadata(self):
+      """Compact model metadata, see model_metadata(), from the sidecar file if available"""
+      fmu_hash = self.fmu_hash()
+      if self.meta is None or self.meta_hash != fmu_hash:
+         meta = self.read_sidecar('meta')
+         if meta is None:
+            meta = model_metadata(self.get_model_description())
+            self.write_sidecar('meta', meta)
+         self.meta = meta
+         self.meta_hash = fmu_hash
+         self.variables = None
+      return self.meta
+
+   def registry(self):
+      """Variable registry of the FMU, see variable_registry()"""
+      meta = self.metadata()
+      if self.variables is None: 
+         self.variables = {name: VariableInfo(*v) for name, v in meta['variables'].items()}
+      return self.variables
+
+   def initial_values(self, start_values, names, maxsize=256):
+      """Values of names, e.g. calculated parameters, after initialization with start_values, 
+         from a very short simulation remembered for the last maxsize start_values"""
+      key = SimulationCache.key(self.fmu_hash(), start_values, 0, 0, 0, names)
+      if key not in self.initial:
+         result = self.simulate(start_time=0, stop_time=1e-6, output_interval=1e-6, start_values=start_values, 
+                                output=names, record_events=False)
+         self.initial[key] = {name: result[name][0] for name in names}
+         if len(self.initial) > maxsize: self.initial.popitem(last=False)
+      return self.initial[key]
+
+   def free(self):
+      """Free the FMU instance and remove the extracted files"""
+      if os.getpid() != self.pid: return
+      if self.fmu is not None:
+         try:
+            self.fmu.freeInstance()
+         except Exception:
+            pass
+         self.fmu = None
+      if self.unzipdir is not None:
+         if self.unzipdir != self.shared_unzipdir: shutil.rmtree(self.unzipdir, ignore_errors=True)
+         self.unzipdir = None
+
+   def can_snapshot(self):
+      """True if the FMU state can be captured as bytes and a simulation continued from it"""
+      meta = self.metadata()
+      return meta['interface'] == 'CS' and meta['canGetAndSetFMUstate'] and meta['canSerializeFMUstate']
+
+   def cvode_solver(self):
+      """CVode solver class for the ME FMU, see cvode_solver(), with the Jacobian by coloured
+         finite differences when jacobian is 'colored' and by CVode itself when 'dense'"""
+      key = (self.fmu_hash(), self.jacobian)
+      if self.solver_class is None or self.solver_hash != key:
+         sparsity = self.metadata()['sparsity'] if self.jacobian == 'colored' else None
+         self.solver_class = cvode_solver(sparsity or None)
+         self.solver_hash = key
+      return self.solver_class
+
+   def simulate(self, start_time, stop_time, output_interval, start_values={}, output=None, 
+                capture_state=False, timing=False, fmi_calls=False, **kwargs):
+      """Simulate with the warm instance, arguments as for fmpy.simulate_fmu(). 
+         With capture_state=True the serialized FMU state at stop_time is kept in final_state.
+         For an ME FMU max_step [min] is given to CVode and the counters of the solver are kept 
+         in solver_statistics. With timing=True the time of the phases is kept in timing, see 
+         timing_record(), and with fmi_calls=True the calls of the FMI functions in fmi_calls, 
+         see FMICallStatistics."""
+      self.final_state = None
+      self.timing = {}
+      self.fmi_calls = None
+      max_step = kwargs.pop('max_step', None)
+      capture_state = capture_state and self.can_snapshot()
+      if capture_state: kwargs['terminate'] = False
+      tic = perf_counter()
+      instantiations = self.instantiations
+      fmu = self.load()
+      if self.fmu_used:
+         try:
+            fmu.reset()
+         except Exception:
+            self.fmu_signature = None
+            fmu = self.load()
+      self.fmu_used = True
+      load = perf_counter() - tic
+      timer = None
+      if timing:
+         timer = SimulationTimer(fmu, kwargs.get('step_finished'))
+         kwargs['step_finished'] = timer
+      if fmi_calls:
+         self.fmi_calls = FMICallStatistics()
+         self.fmi_calls.attach(fmu)
+      self.solver_statistics = {}
+      if self.metadata()['type'] == 'ME':
+         solver = self.cvode_solver()
+         solver.statistics = self.solver_statistics
+         solver.max_step = max_step
+         CVodeSolver, sundials.CVodeSolver = sundials.CVodeSolver, solver
+      try:
+         result = simulate_fmu(
+            filename = self.unzipdir,
+            validate = False,
+            start_time = start_time,
+            stop_time = stop_time,
+            output_interval = output_interval,
+            start_values = start_values,
+            output = output,
+            model_description = self.model_description,
+            fmu_instance = fmu,
+            **kwargs
+         )
+      finally:
+         if self.metadata()['type'] == 'ME': sundials.CVodeSolver = CVodeSolver
+         if timer is not None: initialisation, integration, sampling = timer.stop()
+         if fmi_calls: self.fmi_calls.detach()
+      tic = perf_counter()
+      if capture_state:
+         state = fmu.getFMUState()
+         self.final_state = fmu.serializeFMUState(state)
+         fmu.freeFMUState(state)
+         fmu.terminate()
+      if timing:
+         self.timing = {'load': load, 'instantiated': self.instantiations != instantiations, 
+                        'initialisation': initialisation, 'integration': integration, 'sampling': sampling, 
+                        'capture': perf_counter() - tic}
+      return result
+
+   def timing_record(self):
+      """Timing of the last simulation [s] together with the counters of the solver"""
+      statistics = self.solver_statistics
+      return dict(self.timing, steps=statistics.get('steps'), rhs=statistics.get('rhs'), 
+                  jacobians=statistics.get('jacobians'), rhs_jacobian=statistics.get('rhs_jacobian'),
+                  events=statistics.get('restarts'))
+
+class SimulationTimer:
+   """Timing of the phases of one simulation by FMUEngine. Used as step_finished in simulate_fmu() 
+      around the given step_finished, where the initialisation ends with exitInitializationMode() 
+      of the FMU and the output sampling is the time in sample() of the recorder from the first 
+      step on. The integration is the rest of the time in simulate_fmu()."""
+
+   def __init__(self, fmu, step_finished=None):
+      self.fmu = fmu
+      self.step_finished = step_finished
+      self.recorder = None
+      self.sampling = 0.0
+      self.initialized = None
+      self.start = perf_counter()
+      exit_initialization = fmu.exitInitializationMode
+      def timed(*args, **kwargs):
+         result = exit_initialization(*args, **kwargs)
+         self.initialized = perf_counter()
+         return result
+      fmu.exitInitializationMode = timed
+
+   def __call__(self, time, recorder):
+      proceed = True if self.step_finished is None else self.step_finished(time, recorder)
+      if recorder is not self.recorder:
+         self.recorder = recorder
+         sample = recorder.sample
+         def timed(time, force=False):
+            tic = perf_counter()
+            sample(time, force)
+            self.sampling += perf_counter() - tic
+         recorder.sample = timed
+      return proceed
+
+   def stop(self):
+      """Remove the timing from the FMU and return time of initialisation, integration and sampling"""
+      del self.fmu.exitInitializationMode
+      initialized = self.initialized or self.start
+      return initialized - self.start, perf_counter() - initialized - self.sampling, self.sampling
+
+class FMICallStatistics:
+   """Number of calls and total time [s] of each FMI function of an FMU instance, aggregated 
+      instead of logged line by line as with fmi_call_logger. The functions FMPy calls through
+      are wrapped by attach() and restored by detach(), and run_time is the time in between. 
+      Statistics of many runs, e.g. from simu_batch(), are added with merge()."""
+
+   def __init__(self, calls=None, run_time=0.0):
+      self.calls = {} if calls is None else calls
+      self.run_time = run_time
+      self.fmu = None
+      self.functions = None
+      self.original = None
+
+   def attach(self, fmu):
+      self.functions = getattr(fmu, '_functions', None)
+      if self.functions is None:
+         print('Error: FMI call statistics need FMPy with the FMI functions in _functions')
+         return
+      self.fmu = fmu
+      self.original = dict(self.functions)
+      for name, function in self.original.items():
+         self.functions[name] = TimedFMIFunction(function, self.calls.setdefault(name, [0, 0.0]))
+      self.start = perf_counter()
+
+   def detach(self):
+      if self.fmu is None: return
+      self.run_time += perf_counter() - self.start
+      self.functions.update(self.original)
+      self.fmu = self.functions = self.original = None
+
+   def table(self):
+      """Dictionary of the functions called as [calls, time], the most time first"""
+      return {name: list(value) for name, value in sorted(self.calls.items(), key=lambda item: -item[1][1]) 
+              if value[0] > 0}
+
+   @classmethod
+   def merge(cls, statistics):
+      """Sum of statistics given as FMICallStatistics or as dictionaries from table()"""
+      merged = cls()
+      for item in statistics:
+         if item is None: continue
+         if isinstance(item, FMICallStatistics):
+            merged.run_time += item.run_time
+            item = item.table()
+         for name, (calls, time) in item.items():
+            value = merged.calls.setdefault(name, [0, 0.0])
+            value[0] += calls
+            value[1] += time
+      return merged
+
+   def show(self):
+      """Print the table with the share of the run time spent in the FMI functions"""
+      table = self.table()
+      total = sum(time for calls, time in table.values())
+      print()
+      print(f"{'FMI function':<36s} {'calls':>9s} {'time [ms]':>10s} {'[us/call]':>10s}")
+      for name, (calls, time) in table.items():
+         print(f'{name:<36s} {calls:9d} {1000*time:10.2f} {1e6*time/calls:10.2f}')
+      print(f"{'Total':<36s} {sum(calls for calls, time in table.values()):9d} {1000*total:10.2f}")
+      if self.run_time > 0:
+         print(f'FMI functions {100*total/self.run_time:.0f} % of the run time {1000*self.run_time:.1f} ms, '
+               'the rest in Python')
+
+class TimedFMIFunction:
+   """FMI function that adds the call and its time to counter [calls, time]"""
+   __slots__ = ('function', 'counter')
+
+   def __init__(self, function, counter):
+      self.function = function
+      self.counter = counter
+
+   def __getattr__(self, attr):
+      return getattr(self.function, attr)
+
+   def __call__(self, *args):
+      tic = perf_counter()
+      result = self.function(*args)
+      self.counter[1] += perf_counter() - tic
+      self.counter[0] += 1
+      return result
+
+def timing_percentiles(records, percentiles=[50, 90, 99]):
+   """Percentiles of each phase and counter over timing records of simu(profile=True) or 
+      simu_batch(profile=True), where records that are None or lack the entry are left out"""
+   records = [record for record in records if record is not None]
+   result = {}
+   for name in dict.fromkeys(name for record in records for name in record):
+      values = [record[name] for record in records 
+                if isinstance(record.get(name), (int, float)) and not isinstance(record.get(name), bool)]
+      if values: result[name] = dict(zip(percentiles, np.percentile(values, percentiles).tolist()))
+   return result
+
+# Compact model metadata kept in a sidecar file by FMUEngine
+def model_metadata(model_description):
+   """Return dictionary with variables, states, derivatives, event indicators and generation information"""
+   interface = model_description.coSimulation or model_description.modelExchange
+   return {'variables': {name: tuple(v) for name, v in variable_registry(model_description).items()},
+           'states': [v.derivative.name for v in model_description.modelVariables if v.derivative is not None],
+           'derivatives': [v.name for v in model_description.modelVariables if v.derivative is not None],
+           'numberOfEventIndicators': model_description.numberOfEventIndicators,
+           'fmiVersion': model_description.fmiVersion,
+           'modelName': model_description.modelName,
+           'generationTool': model_description.generationTool,
+           'generationDateAndTime': model_description.generationDateAndTime,
+           'type': 'CS' if model_description.modelExchange is None else 'ME',
+           'interface': 'CS' if model_description.coSimulation is not None else 'ME',
+           'canGetAndSetFMUstate': interface.canGetAndSetFMUstate,
+           'canSerializeFMUstate': interface.canSerializeFMUstate,
+           'sparsity': jacobian_sparsity(model_description)}
+
+# Sparsity of the Jacobian of the ME FMU from the Derivatives of the model structure
+def jacobian_sparsity(model_description):
+   """Return for each state derivative the indices of the states it depends on, in the order of the 
+      continuous states. A derivative without given dependencies depends on all states."""
+   states = [unknown.variable.derivative for unknown in model_description.derivatives]
+   index = {id(variable): i for i, variable in enumerate(states)}
+   sparsity = []
+   for i, unknown in enumerate(model_description.derivatives):
+      if unknown.dependencies is None:
+         sparsity.append(list(range(len(states))))
+      else:
+         sparsity.append(sorted({i} | {index[id(v)] for v in unknown.dependencies if id(v) in index}))
+   return sparsity
+
+def jacobian_colors(sparsity):
+   """Greedy grouping of the columns of the Jacobian such that no two columns in a group have a 
+      nonzero in the same row. Return array with the group of each column."""
+   n = len(sparsity)
+   pattern = np.zeros((n, n), dtype=bool)
+   for i, columns in enumerate(sparsity): pattern[i, columns] = True
+   colors = np.full(n, -1)
+   for j in range(n):
+      used = set(colors[pattern[pattern[:, j]].any(axis=0)].tolist())
+      colors[j] = next(c for c in range(n) if c not in used)
+   return colors
+
+def cvode_solver(sparsity=None):
+   """Return subclass of the CVodeSolver of FMPy that adds up the counters of CVode over the 
+      restarts at events in the dictionary statistics and takes max_step if not None. With sparsity 
+      from jacobian_sparsity() the Jacobian is evaluated by finite differences with one evaluation 
+      of the derivatives for each group of columns from jacobian_colors(), instead of one for each 
+      state, and these evaluations are counted as 'rhs_jacobian'. The dense linear solver is kept 
+      since FMPy only includes the dense solver of SUNDIALS. For the IEC model CVode needs only a 
+      few Jacobians and the wall-clock time is the same as with the Jacobian of CVode itself, see 
+      benchmark_jacobian() in BPL_IEC_fmpy_benchmark.py."""
+   library = sundials.libraries.sundials_cvode
+   JacobianFunction = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_double, sundials.N_Vector, sundials.N_Vector, 
+                                       sundials.SUNMatrix, ctypes.c_void_p, sundials.N_Vector, 
+                                       sundials.N_Vector, sundials.N_Vector)
+   set_jacobian = library.CVodeSetJacFn
+   set_jacobian.argtypes = [ctypes.c_void_p, JacobianFunction]
+   set_jacobian.restype = ctypes.c_int
+   matrix_data = sundials.libraries.sundials_sunmatrixdense.SUNDenseMatrix_Data
+   matrix_data.argtypes = [sundials.SUNMatrix]
+   matrix_data.restype = ctypes.POINTER(ctypes.c_double)
+   counters = {'steps': library.CVodeGetNumSteps, 'rhs': library.CVodeGetNumRhsEvals,
+               'jacobians': library.CVodeGetNumJacEvals, 'rhs_jacobian': library.CVodeGetNumLinRhsEvals}
+   for counter in counters.values():
+      counter.argtypes = [ctypes.c_void_p, ctypes.POINTER(ctypes.c_long)]
+      counter.restype = ctypes.c_int
+
+   # Rows and columns of the nonzeros for each group of columns
+   if sparsity is not None:
+      colors = jacobian_colors(sparsity)
+      rows = np.array([i for i, columns in enumerate(sparsity) for j in columns])
+      columns = np.array([j for i, columns in enumerate(sparsity) for j in columns])
+      groups = [(np.flatnonzero(colors == c), rows[colors[columns] == c], columns[colors[columns] == c]) 
+                for c in range(colors.max() + 1)]
+
+   class ColoredCVodeSolver(sundials.CVodeSolver):
+
+      statistics = {}
+      max_step = None
+
+      def __init__(self, *args, **kwargs):
+         if self.max_step is not None: kwargs['maxStep'] = self.max_step
+         super().__init__(*args, **kwargs)
+         self.total = dict.fromkeys(counters, 0)
+         self.total['restarts'] = 0
+         self.rhs_jacobian = 0
+         if sparsity is not None and not self.discrete:
+            if len(sparsity) != self.nx: raise RuntimeError('Sparsity of the Jacobian does not match the states')
+            self.x_perturbed = np.empty(self.nx)
+            self.dx_perturbed = np.empty(self.nx)
+            self.px_perturbed = self.x_perturbed.ctypes.data_as(ctypes.POINTER(ctypes.c_double))
+            self.pdx_perturbed = self.dx_perturbed.ctypes.data_as(ctypes.POINTER(ctypes.c_double))
+            self.jacobian_ = JacobianFunction(self.jacobian)
+            if set_jacobian(self.cvode_mem, self.jacobian_) != 0: raise RuntimeError('Call to CVode failed.')
+
+      def jacobian(self, t, y, fy, Jac, user_data, tmp1, tmp2, tmp3):
+         """Jacobian by finite differences for one group of columns at a time"""
+         x = np.ctypeslib.as_array(sundials.NV_DATA_S(y), (self.nx,))
+         dx = np.ctypeslib.as_array(sundials.NV_DATA_S(fy), (self.nx,))
+         # Column major data of the dense matrix, i.e. element [j, i] is the derivative of dx[i] by x[j]
+         J = np.ctypeslib.as_array(matrix_data(Jac), (self.nx, self.nx))
+         J[:] = 0.0
+         h = np.sqrt(np.finfo(float).eps)*np.maximum(np.abs(x), self.npabstol/self.reltol)
+         h = (x + h) - x
+         self.set_time(t)
+         for group, group_rows, group_columns in groups:
+            self.x_perturbed[:] = x
+            self.x_perturbed[group] += h[group]
+            self.set_x(self.px_perturbed, self.nx)
+            self.get_dx(self.pdx_perturbed, self.nx)
+            self.rhs_jacobian += 1
+            J[group_columns, group_rows] = (self.dx_perturbed[group_rows] - dx[group_rows])/h[group_columns]
+         self.set_x(sundials.NV_DATA_S(y), self.nx)
+         return 0
+
+      def count(self):
+         """Counters of CVode since the last restart"""
+         value = ctypes.c_long(0)
+         current = {}
+         for name, counter in counters.items():
+            counter(self.cvode_mem, ctypes.byref(value))
+            current[name] = value.value
+         if sparsity is not None: current['rhs_jacobian'] = self.rhs_jacobian
+         return current
+
+      def step(self, t, tNext):
+         result = super().step(t, tNext)
+         current = self.count()
+         self.statistics.update({name: self.total[name] + current.get(name, 0) for name in self.total})
+         return result
+
+      def reset(self, time):
+         for name, value in self.count().items(): self.total[name] += value
+         self.total['restarts'] += 1
+         self.rhs_jacobian = 0
+         super().reset(time)
+
+   return ColoredCVodeSolver
+
+global engine; engine = FMUEngine(fmu_model)
+
+# Name of the parameter that holds the initial value of a state, e.g. a.c[3] -> a.c_0[3]
+def state_start_name(key):
+   base, bracket, index = key.rpartition('[') if key[-1] == ']' else (key, '', '')
+   if base[-3:] == 'I.y':
+      base = base[:-10]+'I'
+   elif base[-3:] == 'D.x':
+      base = base[:-10]+'D'
+   return base + '_0' + bracket + index
+
+# Fill stateDict, stateDictInitial and stateDictInitialLoc from the model metadata
+def states_setup():
+   stateDict.clear()
+   stateDict.update({name:None for name in engine.metadata()['states']})
+   stateDict.update(timeDiscreteStates) 
+
+   registry = engine.registry()
+   stateDictInitial.clear()
+   for key in stateDict.keys():
+      name = state_start_name(key)
+      if name in registry:
+         stateDictInitial[key] = name
+      else:
+         print('Error: no initial value parameter', name, 'for state', key)
+
+   stateDictInitialLoc.clear()
+   for value in stateDictInitial.values():
+      stateDictInitialLoc[value] = value
+
+states_setup()
+
+# Cache of simulation results
+class SimulationCache:
+   """Content-addressed cache of simulation results. The key is a hash of the FMU file, the
+      start_values, start and stop time, output interval, grid and solver and the recorded variables. Results are 
+      kept in an in-memory LRU of maxsize entries and, if directory is given, also on disk as .npy 
+      files limited to max_bytes in total. Files are written atomically and can be shared 
+      between processes."""
+
+   def __init__(self, maxsize=32, directory=None, max_bytes=500e6):
+      self.maxsize = maxsize
+      self.directory = directory
+      self.max_bytes = max_bytes
+      self.memory = OrderedDict()
+      self.hits = 0
+      self.misses = 0
+
+   @staticmethod
+   def key(fmu_hash, start_values, start_time, stop_time, output_interval, output, record_events=True, grid=None,
+           solver=None):
+      """Return hash key for a simulation"""
+      def canonical(value):
+         if isinstance(value, (bool, np.bool_)): return bool(value)
+         if isinstance(value, (int, float, np.integer, np.floating)): return repr(float(value))
+         return repr(value)
+      content = {'fmu': fmu_hash,
+                 'start_values': sorted((k, canonical(v)) for k, v in start_values.items()),
+                 'time': [repr(float(start_time)), repr(float(stop_time)), repr(float(output_interval))],
+                 'output': sorted(set(output)),
+                 'record_events': bool(record_events)}
+      if grid is not None: content['grid'] = grid
+      if solver is not None: content['solver'] = sorted((k, repr(v)) for k, v in solver.items())
+      return hashlib.sha256(json.dumps(content).encode()).hexdigest()
+
+   def path(self, key):
+      return os.path.join(self.directory, key + '.npy')
+
+   def get(self, key):
+      """Return a copy of the cached result or None"""
+      if key in self.memory:
+         self.memory.move_to_end(key)
+         self.hits += 1
+         return self.memory[key].copy()
+      if self.directory is not None:
+         try:
+            result = np.load(self.path(key), allow_pickle=False)
+            os.utime(self.path(key))
+         except (FileNotFoundError, ValueError, OSError):
+            result = None
+         if result is not None:
+            self.remember(key, result)
+            self.hits += 1
+            return result.copy()
+      self.misses += 1
+      return None
+
+   def remember(self, key, result):
+      self.memory[key] = result
+      self.memory.move_to_end(key)
+      while len(self.memory) > self.maxsize: self.memory.popitem(last=False)
+
+   def put(self, key, result):
+      """Store result in memory and on disk"""
+      result = np.array(result)
+      self.remember(key, result)
+      if self.directory is not None:
+         os.makedirs(self.directory, exist_ok=True)
+         fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+         try:
+            with os.fdopen(fd, 'wb') as f: np.save(f, result, allow_pickle=False)
+            os.replace(tmp, self.path(key))
+         except OSError:
+            if os.path.exists(tmp): os.remove(tmp)
+         self.evict()
+
+   def evict(self):
+      """Remove least recently used files until the disk store is within max_bytes"""
+      entries = []
+      for entry in os.scandir(self.directory):
+         if entry.name.endswith('.npy'):
+            try:
+               stat = entry.stat()
+            except FileNotFoundError:
+               continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+      total = sum(size for _, size, _ in entries)
+      for _, size, path in sorted(entries):
+         if total <= self.max_bytes: break
+         try:
+            os.remove(path)
+         except FileNotFoundError:
+            pass
+         total -= size
+
+   def clear(self):
+      """Empty memory and disk store"""
+      self.memory.clear()
+      if self.directory is not None and os.path.isdir(self.directory):
+         for entry in os.scandir(self.directory):
+            if entry.name.endswith('.npy'):
+               try:
+                  os.remove(entry.path)
+               except FileNotFoundError:
+                  pass
+
+global simu_cache; simu_cache = SimulationCache()
+
+# Simulation state at prevFinalTime that simu(mode='cont') continues from
+class Snapshot:
+   """State at the end of a simulation. When the FMU supports it the complete FMU state is kept
+      as serialized bytes, including discrete controller states, and the continuation is exact. 
+      Otherwise only the continuous states in stateDict are kept and the FMU is initialised again 
+      with these as _0 parameters."""
+
+   def __init__(self, time, stateDict, parDict, fmu_hash, fmu_state=None):
+      self.time = time
+      self.stateDict = dict(stateDict)
+      self.parDict = dict(parDict)
+      self.fmu_hash = fmu_hash
+      self.fmu_state = fmu_state
+
+   def exact(self):
+      return self.fmu_state is not None
+
+   def to_bytes(self):
+      """Snapshot as bytes to store on disk or send to another process"""
+      return zlib.compress(pickle.dumps(self.__dict__, protocol=pickle.HIGHEST_PROTOCOL))
+
+   @staticmethod
+   def from_bytes(data):
+      snapshot = Snapshot.__new__(Snapshot)
+      snapshot.__dict__.update(pickle.loads(zlib.decompress(data)))
+      return snapshot
+
+global current_snapshot; current_snapshot = None
+
+def snapshot():
+   """Return Snapshot of the simulation state at the end of the last simu(), use snapshot().to_bytes() to store"""
+   if current_snapshot is None:
+      print('Error: No simulation done')
+      return None
+   return current_snapshot
+
+def restore(snapshot):
+   """Restore simulation state from a Snapshot or its bytes, then simu(mode='cont') continues from it.
+      Parameters are restored too and a later par() makes the continuation go through _0 parameters."""
+   global current_snapshot, prevFinalTime
+   if isinstance(snapshot, bytes): snapshot = Snapshot.from_bytes(snapshot)
+   if snapshot.fmu_hash != engine.fmu_hash():
+      print('Error: Snapshot is from another FMU than', fmu_model)
+      return
+   parDict.update(snapshot.parDict)
+   stateDict.update(snapshot.stateDict)
+   prevFinalTime = snapshot.time
+   current_snapshot = snapshot
+
+# Results on disk that grow over many simulations
+class ResultStore:
+   """Columnar store of recorded results in directory with one raw file per variable and a 
+      header.json with names, dtypes and length. Results are appended in chunks of chunk rows 
+      and read back zero-copy as numpy.memmap, eg store['time']. A continuation that starts at 
+      the last stored time does not repeat that row. The store can be given as sim_res to show()."""
+
+   def __init__(self, directory, chunk=10000):
+      self.directory = directory
+      self.chunk = chunk
+      self.header = {'names': [], 'dtypes': [], 'length': 0}
+      if os.path.exists(self.path('header.json')):
+         with open(self.path('header.json')) as f: self.header = json.load(f)
+
+   def path(self, name):
+      return os.path.join(self.directory, name)
+
+   def file(self, name):
+      return self.path('v{}.bin'.format(self.header['names'].index(name)))
+
+   @property
+   def dtype(self):
+      return np.dtype(list(zip(self.header['names'], self.header['dtypes'])))
+
+   def __len__(self):
+      return self.header['length']
+
+   def __contains__(self, name):
+      return name in self.header['names']
+
+   def __getitem__(self, name):
+      """Read-only numpy.memmap of variable name, or a structured copy for a list of names"""
+      if isinstance(name, list):
+         res = np.empty(len(self), dtype=[(n, self.dtype[n]) for n in name])
+         for n in name: res[n] = self[n]
+         return res
+      if name not in self: raise KeyError(name)
+      if len(self) == 0: return np.empty(0, dtype=self.dtype[name])
+      return np.memmap(self.file(name), dtype=self.dtype[name], mode='r', shape=(len(self),))
+
+   def write_header(self):
+      fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+      with os.fdopen(fd, 'w') as f: json.dump(self.header, f)
+      os.replace(tmp, self.path('header.json'))
+
+   def append(self, result):
+      """Append the rows of a structured array such as sim_res"""
+      if len(self.header['names']) == 0:
+         os.makedirs(self.directory, exist_ok=True)
+         self.header['names'] = list(result.dtype.names)
+         self.header['dtypes'] = [result.dtype[n].str for n in result.dtype.names]
+      missing = [n for n in self.header['names'] if n not in result.dtype.names]
+      if missing: raise ValueError('Variables not in result: ' + ', '.join(missing))
+      if len(self) > 0 and len(result) > 0 and result['time'][0] == self['time'][-1]: result = result[1:]
+      dtype = self.dtype
+      for name in self.header['names']:
+         # Rows after length are left from an interrupted append
+         with open(self.file(name), 'ab') as f:
+            f.truncate(len(self)*dtype[name].itemsize)
+            for k in range(0, len(result), self.chunk):
+               f.write(np.ascontiguousarray(result[name][k:k+self.chunk], dtype=dtype[name]).tobytes())
+      self.header['length'] += len(result)
+      self.write_header()
+
+   def clear(self):
+      """Remove all stored results"""
+      for k in range(len(self.header['names'])):
+         if os.path.exists(self.path('v{}.bin'.format(k))): os.remove(self.path('v{}.bin'.format(k)))
+      self.header = {'names': [], 'dtypes': [], 'length': 0}
+      if os.path.exists(self.path('header.json')): os.remove(self.path('header.json'))
+
+# Help function to extract variables to be stored from the diagrams
+def extract_variables(diagrams):
+   output = []
+   variables = [name for name, v in engine.registry().items() if v.causality == 'local']
+   for j in range(len(diagrams)):
+      for k in range(len(variables)):
+         if variables[k] in diagrams[j]:
+            output.append(variables[k])
+   return output
+
+# Column in NumPy as an alternative to the FMU
+class ColumnModel:
+   """Column of any number of sections with the species P, A, E, PS and AS as in the FMU. Each 
+      section is ideally mixed and P, A and E flow on to the next section. Binding follows 
+      P + ES <-> PS + E with k1, k2 and A + ES <-> AS + E with k3, k4, where the free binding 
+      sites are ES = Q_av - PS - AS. E_0 is the initial E in the first section only, as in the FMU.
+      The right-hand side is vectorized over the sections and the 
+      Jacobian is banded and given as a sparse matrix to solve_ivp(). The inlet flow and 
+      concentrations are given as functions of time, eg from a result of the FMU.
+      With ensemble as a dictionary of arrays of parameters, eg {'k1': k1_samples}, all members 
+      are simulated as one system with a block diagonal Jacobian and other parameters from parDict."""
+
+   species = 5
+   parameters = ['k1', 'k2', 'k3', 'k4', 'Q_av', 'x_m', 'diameter', 'height', 'E_0']
+
+   def __init__(self, sections=8, parDict=parDict, ensemble=None):
+      if ensemble is None: ensemble = {}
+      self.sections = sections
+      self.members = max([np.size(v) for v in ensemble.values()], default=1)
+      p = {k: np.broadcast_to(np.asarray(ensemble.get(k, parDict[k]), dtype=float), (self.members,)) 
+           for k in self.parameters}
+      self.k1, self.k2, self.k3, self.k4, self.Q_av = [p[k][:, None] for k in ['k1', 'k2', 'k3', 'k4', 'Q_av']]
+      self.V = np.pi*p['diameter']**2/4*p['height']
+      self.V_m = p['x_m']*self.V
+      self.V_section = (self.V_m/sections)[:, None]
+      self.c_0 = np.zeros((self.members, sections, self.species))
+      self.c_0[:, 0, 2] = p['E_0']
+
+      # Sparsity of the Jacobian - a full block per section and flow from the section before in each member
+      n, m = self.members*sections, self.species
+      first = np.arange(n)[:, None, None]*m
+      block_rows = np.broadcast_to(first + np.arange(m)[:, None], (n, m, m))
+      block_cols = np.broadcast_to(first + np.arange(m)[None, :], (n, m, m))
+      flow_sections = (np.arange(self.members)[:, None]*sections + np.arange(1, sections)[None, :]).ravel()
+      flow_rows = (flow_sections[:, None]*m + np.arange(3)[None, :]).ravel()
+      self.rows = np.concatenate([block_rows.ravel(), flow_rows])
+      self.cols = np.concatenate([block_cols.ravel(), flow_rows - m])
+
+   def inlet_from(self, res, concentrations=None):
+      """Use the inlet recorded at inlet_variables in the result res, mixed from the inlet_sources 
+         with concentrations as array (source, species), by default from inlet_concentrations()"""
+      if concentrations is None: concentrations = inlet_concentrations()
+      t = res['time']
+      flows = -np.stack([res[name] for name in inlet_variables], axis=1)
+      def inlet(time):
+         F_sources = np.array([np.interp(time, t, F) for F in flows.T])
+         F = F_sources.sum()
+         return F, (F_sources @ concentrations/F if F > 0 else np.zeros(3))
+      self.inlet = inlet
+
+   def rates(self, c):
+      ES = self.Q_av - c[..., 3] - c[..., 4]
+      r1 = self.k1*c[..., 0]*ES - self.k2*c[..., 2]*c[..., 3]
+      r2 = self.k3*c[..., 1]*ES - self.k4*c[..., 2]*c[..., 4]
+      return ES, r1, r2
+
+   def rhs(self, time, y):
+      c = y.reshape(self.members, self.sections, self.species)
+      F, c_in = self.inlet(time)
+      _, r1, r2 = self.rates(c)
+      upstream = np.concatenate([np.broadcast_to(c_in, (self.members, 1, 3)), c[:, :-1, :3]], axis=1)
+      dc = np.empty_like(c)
+      dc[..., :3] = (F/self.V_section)[..., None]*(upstream - c[..., :3])
+      dc[..., 0] -= r1
+      dc[..., 1] -= r2
+      dc[..., 2] += r1 + r2
+      dc[..., 3] = r1
+      dc[..., 4] = r2
+      return dc.ravel()
+
+   def jacobian(self, time, y):
+      c = y.reshape(self.members, self.sections, self.species)
+      F, _ = self.inlet(time)
+      D = np.broadcast_to(F/self.V_section, (self.members, self.sections))
+      ES, _, _ = self.rates(c)
+      zero = np.zeros_like(ES)
+      dr1 = np.stack([self.k1*ES, zero, -self.k2*c[..., 3], -self.k1*c[..., 0] - self.k2*c[..., 2], 
+                      -self.k1*c[..., 0]], axis=-1)
+      dr2 = np.stack([zero, self.k3*ES, -self.k4*c[..., 4], -self.k3*c[..., 1], 
+                      -self.k3*c[..., 1] - self.k4*c[..., 2]], axis=-1)
+      block = np.stack([-dr1, -dr2, dr1 + dr2, dr1, dr2], axis=-2)
+      block[..., [0, 1, 2], [0, 1, 2]] -= D[..., None]
+      data = np.concatenate([block.ravel(), np.repeat(D[:, 1:].ravel(), 3)])
+      size = self.members*self.sections*self.species
+      return sparse.csc_matrix((data, (self.rows, self.cols)), shape=(size, size))
+
+   def solve(self, time, rtol=1e-6, atol=1e-9):
+      """Concentrations at the given increasing times as array (member, time, section, species)"""
+      t = np.unique(time)
+      solution = integrate.solve_ivp(self.rhs, (t[0], t[-1]), self.c_0.ravel(), method='BDF', t_eval=t, 
+                                     jac=self.jacobian, rtol=rtol, atol=atol, 
+                                     max_step=np.max(np.diff(t)) if len(t) > 1 else np.inf)
+      if not solution.success: raise RuntimeError(solution.message)
+      c = solution.y.reshape(self.members, self.sections, self.species, len(t)).transpose(0, 3, 1, 2)
+      return c[:, np.searchsorted(t, time)]
+
+   def simulate(self, time, rtol=1e-6, atol=1e-9):
+      """Concentrations of the first member at the given times as array (time, section, species)"""
+      return self.solve(time, rtol, atol)[0]
+
+def inlet_concentrations():
+   """Concentrations of P, A and E from the inlet_sources with parDict as array (source, species)"""
+   names = [source + '.outlet.c[{}]'.format(i) for source in inlet_sources for i in range(1, 4)]
+   values = engine.initial_values({parLocation[k]: parDict[k] for k in parDict.keys()}, names)
+   return np.array([values[name] for name in names]).reshape(len(inlet_sources), 3)
+
+def column_simulate(res, sections=8):
+   """Simulate ColumnModel with parDict driven by the inlet recorded in the FMU result res and 
+      return a result like sim_res. The column variables are replaced by those of ColumnModel and 
+      the variables of the components in column_downstream are nan, other variables are as in res."""
+   model = ColumnModel(sections)
+   model.inlet_from(res)
+   c = model.simulate(res['time'])
+   names = ['column.column_section[{}].c[{}]'.format(j, i) for j in range(1, sections+1) for i in range(1, 6)]
+   outlets = ['column.column_section[{}].outlet.c[{}]'.format(sections, i) for i in range(1, 6)]
+   outlets += ['column.outlet.c[{}]'.format(i) for i in range(1, 6)]
+   volumes = ['column.column_section[{}].V_m'.format(j) for j in range(1, sections+1)]
+   volumes = [name for name in volumes if name in res.dtype.names]
+   kept = [(name, res.dtype[name]) for name in res.dtype.names 
+           if not name.startswith('column.column_section[') and not name.startswith('column.outlet.')]
+   column_res = np.empty(len(res), dtype=kept + [(name, np.float64) for name in names + outlets + volumes])
+   for name, _ in kept:
+      downstream = any(name.startswith(component + '.') for component in column_downstream)
+      column_res[name] = np.nan if downstream and column_res.dtype[name].kind == 'f' else res[name]
+   for j in range(sections):
+      for i in range(5):
+         column_res[names[j*5 + i]] = c[:, j, i]
+   for k, name in enumerate(outlets):
+      column_res[name] = c[:, -1, k % 5] if k % 5 < 3 else 0
+   if 'column.V' in res.dtype.names: column_res['column.V'] = model.V[0]
+   if 'column.V_m' in res.dtype.names: column_res['column.V_m'] = model.V_m[0]
+   for name in volumes: column_res[name] = model.V_section[0, 0]
+   return column_res
+
+def column_ensemble(ensemble, res=None, sections=8, variables=None):
+   """Simulate ColumnModel for all members of ensemble, a dictionary of parameter arrays, in one 
+      solve driven by the inlet of res, by default the last simulation with the FMU. Returns the 
+      times, the variable names and an array (member, time, variable), by default with the outlet 
+      concentrations. Example of Monte Carlo over uncertain k1 and k2:
+      column_ensemble({'k1': 0.3*rng.lognormal(0, 0.1, 1000), 'k2': 0.05*rng.lognormal(0, 0.1, 1000)})"""
+   if res is None: res = inlet_res
+   if res is None:
+      print("Error: Simulation is first done with the FMU for the inlet to the column")
+      return None
+   if variables is None: variables = ['column.column_section[{}].outlet.c[{}]'.format(sections, i) for i in range(1, 4)]
+   model = ColumnModel(sections, ensemble=ensemble)
+   model.inlet_from(res)
+   c = model.solve(res['time'])
+   index = []
+   for name in variables:
+      section, species = [int(x) for x in name.replace(']', '[').split('[')[1::2]]
+      index.append((section - 1)*model.species + species - 1)
+   return res['time'], variables, c.reshape(model.members, len(res), -1)[..., index]
+
+# The last result from the FMU in mode 'init' that drives ColumnModel in simu(backend='numpy')
+global inlet_res; inlet_res = None
+
+# Output grid with dense sampling only in the phases where the signals move
+class OutputGrid:
+   """The simulation steps with interval as for a uniform grid, but in recorded results only 
+      every coarse:th point is kept outside the windows. Event points and the stop time are always
+      kept. Used as step_finished in simulate_fmu(), where the sampling of the recorder is 
+      filtered so the dropped points are never read from the FMU."""
+
+   def __init__(self, start_time, stop_time, interval, windows, coarse=10):
+      self.start_time = start_time
+      self.stop_time = stop_time
+      self.interval = interval
+      self.windows = sorted(windows)
+      self.coarse = coarse
+      self.recorder = None
+
+   def key(self):
+      """Return the part of the grid that is not given by time and output interval for cache keys"""
+      return [self.coarse, [[repr(float(t0)), repr(float(t1))] for t0, t1 in self.windows]]
+
+   def keep(self, time):
+      k = round((time - self.start_time)/self.interval)
+      if not np.isclose(self.start_time + k*self.interval, time): return True
+      if k % self.coarse == 0 or np.isclose(time, self.stop_time): return True
+      return any(t0 <= time <= t1 for t0, t1 in self.windows)
+
+   def __call__(self, time, recorder):
+      if recorder is not self.recorder:
+         self.recorder = recorder
+         sample = recorder.sample
+         def filtered(time, force=False):
+            if force or self.keep(time): sample(time, force)
+         recorder.sample = filtered
+      return True
+
+# Scale factor of the switch points as control_buffer2.scaling in the model
+def switch_scaling():
+   """Return the scale factor of the switch points for parDict, the column flow rate F [mL/min] 
+      when they are given in volume, otherwise 1. Read as 'scaling' from the model after 
+      initialization when available."""
+   if 'scaling' in engine.registry():
+      start_values = {parLocation[k]:parDict[k] for k in parDict.keys()}
+      return float(engine.initial_values(start_values, ['scaling'])['scaling'])
+   if not parDict['scale_volume']: return 1
+   return parDict['LFR']*np.pi*parDict['diameter']**2/4/60
+
+def output_grid(start_time, stop_time, options=opts_std):
+   """Return OutputGrid for options with 'grid': 'phase', otherwise None for a uniform grid. The 
+      windows are the phases in grid_phases at the switch times of parDict, widened by one coarse 
+      interval on both sides, so the grid only depends on the parameters."""
+   if options.get('grid') != 'phase': return None
+   interval = (stop_time - start_time)/options['NCP']
+   coarse = options.get('coarse', 10)
+   margin = coarse*interval
+   scaling = switch_scaling()
+   windows = [(parDict[start]/scaling - margin, parDict[stop]/scaling + margin) for start, stop in grid_phases]
+   windows = [(t0, t1) for t0, t1 in windows if t1 > start_time and t0 < stop_time]
+   return OutputGrid(start_time, stop_time, interval, windows, coarse)
+
+def solver_settings(options=opts_std, output_interval=None):
+   """Return keyword arguments of FMUEngine.simulate() for the profile in solver_profiles given by 
+      options 'profile', where 'relative_tolerance' and 'max_step' also given in options take 
+      precedence"""
+   settings = dict(solver_profiles[options.get('profile', 'standard')])
+   settings.update({k: options[k] for k in ['relative_tolerance', 'max_step'] if k in options})
+   return {k: v for k, v in settings.items() if v is not None}
+
+def solver_check(options=opts_std):
+   """Return True if options give a solver profile that can be used, otherwise print why not"""
+   if options.get('profile', 'standard') not in solver_profiles:
+      print('Error: Solver profile not correct, one of', list(solver_profiles.keys()))
+      return False
+   if options.get('solver', 'CVode') != 'CVode':
+      print('Error: Only the solver CVode can be used - the model is stiff and a fixed step solver like', 
+            options['solver'], 'fails at any step size of practical use')
+      return False
+   return True
+
+# Simulate with engine unless the result is available in simu_cache
+def cached_simulate(cache, start_time, stop_time, output_interval, start_values, output, record_events=True, 
+                    output_grid=None, solver=None, **kwargs):
+   if output_grid is not None: kwargs['step_finished'] = output_grid
+   if solver is not None: kwargs.update(solver)
+   if not cache:
+      return engine.simulate(start_time=start_time, stop_time=stop_time, output_interval=output_interval,
+                             start_values=start_values, output=output, record_events=record_events, **kwargs)
+   key = SimulationCache.key(engine.fmu_hash(), start_values, start_time, stop_time, output_interval, 
+                             output, record_events, None if output_grid is None else output_grid.key(), solver)
+   result = simu_cache.get(key)
+   engine.final_state = None
+   engine.timing = {}
+   engine.solver_statistics = {}
+   engine.fmi_calls = None
+   if result is None:
+      result = engine.simulate(start_time=start_time, stop_time=stop_time, output_interval=output_interval,
+                               start_values=start_values, output=output, record_events=record_events, **kwargs)
+      simu_cache.put(key, result)
+   return result
+
 # Define simulation
-def simu(simulationTime=simulationTime, mode='Initial', options=opts_std, diagrams=diagrams):
-   """Model loaded and given intial values and parameter before, and plot window also setup before."""   
+def simu(simulationTime=simulationTime, mode='Initial', options=opts_std, diagrams=diagrams, cache=True, plot=None,
+         store=None, backend='fmu', profile=False, fmi_calls=False):
+   """Model loaded and given intial values and parameter before, and plot window also setup before.
+      With cache=True a result from an identical earlier simulation is taken from simu_cache.
+      With plot=False, or plot=None and headless=True, no diagrams are evaluated.
+      With options 'grid': 'phase' the output is dense only in the phases, see output_grid().
+      With options 'profile' the solver and tolerance are taken from solver_profiles.
+      With store given as a ResultStore the result is also appended to it.
+      With backend='surrogate' nothing is simulated and the KPIs estimated by surrogate for parDict 
+      are returned as a dictionary of (mean, standard deviation).
+      With backend='numpy' the column is simulated by ColumnModel with options 'sections', driven 
+      by the inlet of the last simulation with the FMU, see column_simulate().
+      With profile=True a timing record [s] of the phases load, initialisation, integration, sampling, 
+      capture of the FMU state, states for stateDict and diagrams is returned together with the 
+      counters of the solver, see timing_percentiles() to aggregate records. A result taken from the 
+      cache has only 'cache_hit' True and the time outside the simulation, and a note is printed.
+      With fmi_calls=True the calls of the FMI functions are counted and timed and the table is 
+      printed, and with profile=True also given in the timing record, see FMICallStatistics. 
+      The cache is then not used so that the FMU is always called."""   
    
    # Global variables
-   global sim_res, prevFinalTime, stateDict, stateDictInitial, stateDictInitialLoc, start_values
+   global sim_res, prevFinalTime, stateDict, stateDictInitial, stateDictInitialLoc, start_values, current_snapshot
+   global inlet_res
+   
+   # Estimate without simulation
+   if backend in ['surrogate']:
+      if surrogate is None:
+         print("Error: No surrogate, create one first, eg surrogate = KPISurrogate(['LFR', 'stop_adsorption'])")
+         return None
+      return surrogate.predict(parDict)
+   elif backend in ['numpy']:
+      if mode not in ['Initial', 'initial', 'init']:
+         print("Error: Simulation with backend='numpy' is done with mode = 'init'")
+         return None
+      if inlet_res is None or inlet_res['time'][-1] < simulationTime:
+         print("Error: Simulation is first done with the FMU for the inlet to the column")
+         return None
+      sim_res = column_simulate(inlet_res[inlet_res['time'] <= simulationTime], options.get('sections', 8))
+      if plot is None: plot = not headless
+      if plot:
+         linetype = next(linecycler)
+         for command in diagrams: 
+            if set(extract_variables([command])) <= set(sim_res.dtype.names): eval(command)
+      return None
+   elif backend not in ['fmu']:
+      print('Error: Simulation backend not correct')
+      return None
+   if not solver_check(options): return None
+   solver = solver_settings(options, simulationTime/options['NCP'])
    
+   # Variables recorded - also the kpi_variables when a surrogate learns from the simulations
+   output = list(set(extract_variables(diagrams) + list(stateDict.keys()) + key_variables
+                     + (kpi_variables if surrogate is not None else [])))
+
+   # Calls of the FMI functions are only counted when the FMU is called
+   if fmi_calls: cache = False
+
    # Simulation flag
    simulationDone = False
-   
-   # Internal help function to extract variables to be stored
-   def extract_variables(diagrams):
-       output = []
-       variables = [v for v in model_description.modelVariables if v.causality == 'local']
-       for j in range(len(diagrams)):
-           for k in range(len(variables)):
-               if variables[k].name in diagrams[j]:
-                   output.append(variables[k].name)
-       return output
+   tic_total = perf_counter()
 
    # Run simulation
    if mode in ['Initial', 'initial', 'init']: 
@@ -1215,16 +2581,19 @@ def simu(simulationTime=simulationTime, mode='Initial', options=opts_std, diagra
       start_values = {parLocation[k]:parDict[k] for k in parDict.keys()}
       
       # Simulate
-      sim_res = simulate_fmu(
-         filename = fmu_model,
-         validate = False,
+      sim_res = cached_simulate(
+         cache = cache,
          start_time = 0,
          stop_time = simulationTime,
          output_interval = simulationTime/options['NCP'],
          record_events = True,
+         output_grid = output_grid(0, simulationTime, options),
+         solver = solver,
          start_values = start_values,
-         fmi_call_logger = None,
-         output = list(set(extract_variables(diagrams) + list(stateDict.keys()) + key_variables))
+         fmi_calls = fmi_calls,
+         capture_state = True,
+         timing = profile,
+         output = output
       )
       
       simulationDone = True
@@ -1233,6 +2602,25 @@ def simu(simulationTime=simulationTime, mode='Initial', options=opts_std, diagra
       
       if prevFinalTime == 0: 
          print("Error: Simulation is first done with default mode = init'")
+      
+      elif current_snapshot is not None and current_snapshot.exact() and current_snapshot.parDict == parDict:
+         
+         # Continue from the FMU state - not cached since the result depends on the state
+         sim_res = engine.simulate(
+            start_time = prevFinalTime,
+            stop_time = prevFinalTime + simulationTime,
+            output_interval = simulationTime/options['NCP'],
+            record_events = True,
+            step_finished = output_grid(prevFinalTime, prevFinalTime + simulationTime, options),
+            fmu_state = current_snapshot.fmu_state,
+            fmi_calls = fmi_calls,
+            capture_state = True,
+            timing = profile,
+            **solver,
+            output = output
+         )
+         
+         simulationDone = True
          
       else:         
          # Update parDictMod and create parLocationMod
@@ -1251,16 +2639,19 @@ def simu(simulationTime=simulationTime, mode='Initial', options=opts_std, diagra
          start_values = {parLocationMod[k]:parDictMod[k] for k in parDictMod.keys()}
   
          # Simulate
-         sim_res = simulate_fmu(
-            filename = fmu_model,
-            validate = False,
+         sim_res = cached_simulate(
+            cache = cache,
             start_time = prevFinalTime,
             stop_time = prevFinalTime + simulationTime,
             output_interval = simulationTime/options['NCP'],
             record_events = True,
+            output_grid = output_grid(prevFinalTime, prevFinalTime + simulationTime, options),
+            solver = solver,
             start_values = start_values,
-            fmi_call_logger = None,
-            output = list(set(extract_variables(diagrams) + list(stateDict.keys()) + key_variables))
+            fmi_calls = fmi_calls,
+            capture_state = True,
+            timing = profile,
+            output = output
          )
       
          simulationDone = True
@@ -1268,21 +2659,777 @@ def simu(simulationTime=simulationTime, mode='Initial', options=opts_std, diagra
       
       print("Error: Simulation mode not correct")
 
+   if plot is None: plot = not headless
+
    if simulationDone:
       
+      # Timing of the simulation itself - empty if taken from the cache
+      if profile: 
+         timing = dict(engine.timing_record(), cache_hit=not engine.timing)
+         if timing['cache_hit']: 
+            print('Note: Result taken from simu_cache and only the time of the lookup is in the timing record,',
+                  'use cache=False to time the simulation')
+      
       # Plot diagrams from simulation
-      linetype = next(linecycler)    
-      for command in diagrams: eval(command)
+      tic = perf_counter()
+      if plot:
+         linetype = next(linecycler)    
+         for command in diagrams: eval(command)
+      if profile: timing['diagrams'] = perf_counter() - tic
    
-      # Store final state values in stateDict:        
-      for key in stateDict.keys(): stateDict[key] = model_get(key)  
+      # Store final state values in stateDict - gathered from the last row of sim_res:
+      tic = perf_counter()
+      state_names = list(stateDict.keys())
+      if set(state_names) <= set(sim_res.dtype.names):
+         stateDict.update(zip(state_names, sim_res[state_names][-1].tolist()))
+      else:
+         for key in state_names: stateDict[key] = model_get(key)  
+      if profile: timing['states'] = perf_counter() - tic
          
       # Store time from where simulation will start next time
       prevFinalTime = sim_res['time'][-1]
       
+      # Snapshot for the next 'cont', with FMU state if captured by the engine
+      current_snapshot = Snapshot(prevFinalTime, stateDict, parDict, engine.fmu_hash(), engine.final_state)
+
+      # Append to the store on disk
+      if store is not None: store.append(sim_res)
+
+      # Observation of the KPIs for the surrogate
+      if mode in ['Initial', 'initial', 'init'] and set(kpi_variables) <= set(sim_res.dtype.names):
+         record_kpi([parDict], simulationTime, pooling_kpi(sim_res))
+
+      # Inlet of the column for backend='numpy'
+      if mode in ['Initial', 'initial', 'init'] and set(inlet_variables) <= set(sim_res.dtype.names):
+         inlet_res = sim_res
+
+      # Calls of the FMI functions - not available if taken from the cache
+      if fmi_calls and engine.fmi_calls is not None:
+         engine.fmi_calls.show()
+         if profile: timing['fmi_calls'] = engine.fmi_calls
+
+      if profile:
+         timing['total'] = perf_counter() - tic_total
+         return timing
+      
    else:
       print('Error: No simulation done')
-            
+
+# Worker side of simu_batch() - each worker process keeps its own warm FMUEngine
+def batch_worker_init(fmu_model, model_description, unzipdir):
+   global engine
+   engine = FMUEngine(fmu_model, model_description, unzipdir)
+
+def batch_worker(job):
+   """Simulate one job of simu_batch() and return (index, status, message, result, timing)"""
+   index, start_values, stop_time, output_interval, output, solver, profile, fmi_calls = job
+   try:
+      result = engine.simulate(
+         start_time = 0,
+         stop_time = stop_time,
+         output_interval = output_interval,
+         record_events = False,
+         start_values = start_values,
+         output = output,
+         timing = profile,
+         fmi_calls = fmi_calls,
+         **solver
+      )
+   except Exception as e:
+      return index, 'failed', str(e), None, None
+   record = dict(engine.timing_record(), cache_hit=False) if profile else None
+   if fmi_calls: record = dict(record or {}, fmi_calls=engine.fmi_calls)
+   return index, 'ok', '', result, record
+
+global batch_pool; batch_pool = None
+global batch_unzipdir; batch_unzipdir = None
+global batch_hash; batch_hash = None
+
+def batch_shutdown():
+   """Shut down the process pool of simu_batch() and remove the FMU extracted for its workers, 
+      which exit without running atexit and so never clean up themselves"""
+   global batch_pool, batch_unzipdir
+   if batch_pool is not None:
+      batch_pool.shutdown()
+      batch_pool = None
+   if batch_unzipdir is not None:
+      shutil.rmtree(batch_unzipdir, ignore_errors=True)
+      batch_unzipdir = None
+
+atexit.register(batch_shutdown)
+
+def batch_executor(workers):
+   """Return a process pool with the given number of workers, reused between calls. The FMU is 
+      extracted once here and shared by the workers, and a new pool is made when the FMU has changed."""
+   global batch_pool, batch_unzipdir, batch_hash
+   if batch_pool is not None and (batch_pool._max_workers != workers or batch_hash != engine.fmu_hash()):
+      batch_shutdown()
+   if batch_pool is None:
+      if 'fork' in multiprocessing.get_all_start_methods():
+         context = multiprocessing.get_context('fork')
+      else:
+         context = multiprocessing.get_context('spawn')
+      batch_unzipdir = fmpy.extract(fmu_model)
+      batch_hash = engine.fmu_hash()
+      batch_pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                      initializer=batch_worker_init, 
+                      initargs=(fmu_model, engine.get_model_description(), batch_unzipdir))
+   return batch_pool
+
+# Define batch simulation
+def simu_batch(parDicts, simulationTime=simulationTime, outputs=None, options=opts_std, workers=None, cache=True,
+               profile=False, fmi_calls=False):
+   """Simulate a list of parameter dictionaries in parallel from mode 'init'. Each dictionary 
+      only holds the changes relative to the current parDict and is checked against parCheck. 
+      Returns a dictionary with outputs as arrays (run x time) together with the per-run
+      'status' ('ok', 'invalid' or 'failed'), 'message' and the resolved 'parDict'. 
+      With cache=True results are taken from and stored in simu_cache.
+      With profile=True the timing record of each run, as for simu(), is given in 'timing'.
+      With fmi_calls=True the calls of the FMI functions summed over the simulated runs are given 
+      in 'fmi_calls' as FMICallStatistics."""
+
+   if outputs is None: outputs = extract_variables(diagrams)
+   outputs = [name for name in outputs if name != 'time']
+   if workers is None: workers = os.cpu_count()
+   if not solver_check(options): return None
+   solver = solver_settings(options, simulationTime/options['NCP'])
+
+   # Resolve and check parameter dictionaries
+   n = len(parDicts)
+   status = np.full(n, 'ok', dtype=object)
+   message = ['']*n
+   parDicts_resolved = []
+   jobs = []
+   for index, x in enumerate(parDicts):
+      parDict_run = parDict.copy()
+      unknown = [key for key in x.keys() if key not in parDict.keys()]
+      parDict_run.update(x)
+      parDicts_resolved.append(parDict_run)
+      _, parErrors = check(parDict_run)
+      if unknown:
+         status[index] = 'invalid'
+         message[index] = 'Not accessible parameters: ' + ', '.join(unknown)
+      elif parErrors:
+         status[index] = 'invalid'
+         message[index] = 'Requirements do not hold: ' + ', '.join(parErrors)
+      else:
+         start_values = {parLocation[k]:parDict_run[k] for k in parDict_run.keys()}
+         jobs.append((index, start_values, simulationTime, simulationTime/options['NCP'], outputs, solver, profile, fmi_calls))
+
+   # Take results available in the cache and simulate the rest - in this process if only one worker
+   batch_cached_results = []
+   keys = {}
+   if cache:
+      fmu_hash = engine.fmu_hash()
+      jobs_left = []
+      for job in jobs:
+         index, start_values, stop_time, output_interval, output, solver, _, _ = job
+         keys[index] = SimulationCache.key(fmu_hash, start_values, 0, stop_time, output_interval, output, False,
+                                           solver=solver)
+         result = simu_cache.get(keys[index])
+         if result is None:
+            jobs_left.append(job)
+         else:
+            batch_cached_results.append((index, 'ok', '', result, {'cache_hit': True} if profile else None))
+      jobs = jobs_left
+   if workers == 1 or len(jobs) <= 1:
+      batch_worker_results = map(batch_worker, jobs)
+   else:
+      batch_worker_results = batch_executor(workers).map(batch_worker, jobs, 
+                                                          chunksize=max(1, len(jobs)//(4*workers)))
+   batch_worker_results = list(batch_worker_results)
+   if cache:
+      for index, run_status, _, result, _ in batch_worker_results:
+         if run_status == 'ok': simu_cache.put(keys[index], result)
+   batch_worker_results = batch_cached_results + batch_worker_results
+   
+   # Stack results as run x time
+   batch_res = {}
+   timing = [None]*n
+   for index, run_status, run_message, result, run_timing in batch_worker_results:
+      status[index] = run_status
+      message[index] = run_message
+      timing[index] = run_timing
+      if result is None: continue
+      for name in result.dtype.names:
+         values = result[name]
+         if name not in batch_res:
+            batch_res[name] = np.full((n, len(values)), np.nan)
+         batch_res[name][index, :len(values)] = values[:batch_res[name].shape[1]]
+   batch_res['status'] = status
+   batch_res['message'] = message
+   batch_res['parDict'] = parDicts_resolved
+   if profile: batch_res['timing'] = timing
+   if fmi_calls: batch_res['fmi_calls'] = FMICallStatistics.merge(record.get('fmi_calls') for record in timing 
+                                                                 if record is not None)
+
+   # Observations of the KPIs for the surrogate
+   if set(kpi_variables) <= set(batch_res.keys()):
+      ok = np.flatnonzero(status == 'ok')
+      kpi = pooling_kpi({name: batch_res[name][ok] for name in kpi_variables + ['time']}, 
+                        P_in=np.array([parDicts_resolved[i]['P_in'] for i in ok]))
+      record_kpi([parDicts_resolved[i] for i in ok], simulationTime, kpi)
+
+   return batch_res
+
+# Design of experiments over parDict
+def doe_design(bounds, method='lhs', n=64, levels=3, seed=None):
+   """Design over the keys in bounds = {key: (low, high)} returned as a dictionary of arrays. 
+      Method 'factorial' gives levels values per key, as a number or a dictionary per key, 
+      'lhs' gives a Latin hypercube and 'sobol' a scrambled Sobol sequence of n points."""
+   keys = list(bounds.keys())
+   low = np.array([bounds[k][0] for k in keys], dtype=float)
+   high = np.array([bounds[k][1] for k in keys], dtype=float)
+   rng = np.random.default_rng(seed)
+   if method in ['factorial', 'full']:
+      grids = np.meshgrid(*[np.linspace(0, 1, levels[k] if isinstance(levels, dict) else levels) for k in keys], 
+                          indexing='ij')
+      u = np.stack([grid.ravel() for grid in grids], axis=1)
+   elif method in ['lhs', 'latin']:
+      u = (np.argsort(rng.random((n, len(keys))), axis=0) + rng.random((n, len(keys))))/n
+   elif method in ['sobol']:
+      try:
+         u = qmc.Sobol(d=len(keys), scramble=True, seed=seed).random(n)
+      except ImportError:
+         print('Error: Sobol designs need scipy')
+         return None
+   else:
+      print('Error: DOE method not correct')
+      return None
+   x = low + u*(high - low)
+   return {k: x[:, j] for j, k in enumerate(keys)}
+
+def doe_check(design, bounds=None, repair=False):
+   """Return the design with only the points where parCheck holds, checked for all points at once.
+      With repair=True and bounds given, the values of two design keys in a requirement 
+      parDict['a'] < parDict['b'] that does not hold are first swapped if both stay within bounds."""
+   n = len(next(iter(design.values())))
+   design = {k: np.array(v, dtype=float) for k, v in design.items()}
+
+   if repair and bounds is not None:
+      orderings = [requirement(text).ordering for text in parCheck]
+      orderings = [x for x in orderings if x is not None and x[0] in design and x[2] in design]
+      for _ in range(len(orderings)):
+         for a, op, b in orderings:
+            swap = ~requirement("parDict['{}'] {} parDict['{}']".format(a, op, b))(design)
+            swap &= (design[a] >= bounds[b][0]) & (design[a] <= bounds[b][1])
+            swap &= (design[b] >= bounds[a][0]) & (design[b] <= bounds[a][1])
+            design[a][swap], design[b][swap] = design[b][swap], design[a][swap]
+
+   valid = np.broadcast_to(check(design)[0], (n,))
+   if not valid.all(): print('DOE:', np.sum(~valid), 'of', n, 'points dropped since parCheck does not hold')
+   return {k: v[valid] for k, v in design.items()}
+
+def doe(bounds, method='lhs', n=64, levels=3, repair=False, seed=None, simulationTime=cycleTime, 
+        outputs=None, options=opts_std, workers=None, cache=True):
+   """Generate a design with doe_design(), remove points where parCheck does not hold with 
+      doe_check() and simulate the rest in parallel with simu_batch(). Returns the result of
+      simu_batch() with also the 'design' simulated. By default a full cycle is simulated so that 
+      pooling_kpi() of the result is meaningful.
+      Example: doe({'k1': (0.05, 0.2), 'LFR': (0.4, 1.0)}, method='sobol', n=256)"""
+   design = doe_design(bounds, method=method, n=n, levels=levels, seed=seed)
+   if design is None: return None
+   design = doe_check(design, bounds=bounds, repair=repair)
+   n_valid = len(next(iter(design.values())))
+   parDicts = [{k: float(design[k][i]) for k in design.keys()} for i in range(n_valid)]
+   batch_res = simu_batch(parDicts, simulationTime=simulationTime, outputs=outputs, options=options, 
+                          workers=workers, cache=cache)
+   batch_res['design'] = design
+   return batch_res
+
+# Global sensitivity analysis of KPIs over parDict keys
+def sensitivity(bounds, method='sobol', n=256, levels=4, kpis=['yield', 'purity'], bootstrap=100, seed=None,
+                simulationTime=cycleTime, options=opts_std, workers=None, cache=True):
+   """Sensitivity of the KPIs from pooling_kpi() to the keys in bounds = {key: (low, high)}, by 
+      default over a full cycle. 
+      Method 'sobol' uses Saltelli sampling with n(d+2) runs for d keys and gives first order S1 
+      and total ST indices, 'morris' uses n trajectories on levels and gives mu_star and sigma of 
+      the elementary effects. Confidence intervals (95%) are from bootstrap over the base samples. 
+      Runs are simulated with simu_batch() and the time of each stage is given in 'timing'. Runs 
+      where a KPI is nan are dropped for that KPI, and a KPI that is nan or constant in all runs 
+      is left out, both with a warning.
+      Example: sensitivity({'k1': (0.05, 0.2), 'LFR': (0.4, 1.0)}, n=512)"""
+   keys = list(bounds.keys())
+   d = len(keys)
+   low = np.array([bounds[k][0] for k in keys], dtype=float)
+   high = np.array([bounds[k][1] for k in keys], dtype=float)
+   rng = np.random.default_rng(seed)
+   timing = {}
+
+   # Sample matrix in the unit cube
+   start = perf_counter()
+   if method in ['sobol', 'saltelli']:
+      AB = doe_design({j: (0, 1) for j in range(2*d)}, method='lhs', n=n, seed=seed)
+      AB = np.stack([AB[j] for j in range(2*d)], axis=1)
+      A, B = AB[:, :d], AB[:, d:]
+      ABi = np.repeat(A[None, :, :], d, axis=0)
+      for i in range(d): ABi[i, :, i] = B[:, i]
+      U = np.concatenate([A, B, ABi.reshape(-1, d)])
+   elif method in ['morris']:
+      delta = levels/(2*(levels - 1))
+      U = np.empty((n, d+1, d))
+      for r in range(n):
+         U[r, 0] = rng.integers(0, levels//2, d)/(levels - 1)
+         for step, i in enumerate(rng.permutation(d)):
+            U[r, step+1] = U[r, step]
+            U[r, step+1, i] += delta
+      U = U.reshape(-1, d)
+   else:
+      print('Error: Sensitivity method not correct')
+      return None
+   X = low + U*(high - low)
+   timing['sampling'] = perf_counter() - start
+
+   # Simulation
+   start = perf_counter()
+   parDicts = [{k: float(x[j]) for j, k in enumerate(keys)} for x in X]
+   batch_res = simu_batch(parDicts, simulationTime=simulationTime, outputs=kpi_variables, options=options,
+                          workers=workers, cache=cache)
+   timing['simulation'] = perf_counter() - start
+
+   start = perf_counter()
+   kpi = pooling_kpi(batch_res)
+   timing['kpi'] = perf_counter() - start
+
+   # Indices with bootstrap over the base samples
+   start = perf_counter()
+   res = {'method': method, 'keys': keys, 'runs': len(X)}
+   for name in kpis:
+      y = kpi[name]
+      finite = np.isfinite(y)
+      if not finite.any() or np.ptp(y[finite]) == 0:
+         print('Warning: No sensitivity of', name, '- the KPI is', 'nan' if not finite.any() else 'constant', 
+               'in all runs, eg since simulationTime', simulationTime, 'does not cover the pooling')
+         continue
+      if not finite.all(): 
+         print('Warning: Sensitivity of', name, 'without', np.sum(~finite), 'of', len(y), 'runs where the KPI is nan')
+      if method in ['sobol', 'saltelli']:
+         fA, fB, fABi = y[:n], y[n:2*n], y[2*n:].reshape(d, n)
+         rows = np.flatnonzero(np.isfinite(fA) & np.isfinite(fB) & np.all(np.isfinite(fABi), axis=0))
+         if len(rows) < 2 or np.ptp(np.concatenate([fA[rows], fB[rows]])) == 0:
+            print('Warning: No sensitivity of', name, '- too few base samples with the KPI varying')
+            continue
+         def indices(rows):
+            # rows (m) or bootstrap samples of rows (bootstrap, m) give indices (d) or (bootstrap, d)
+            a, b, ab = fA[rows], fB[rows], np.moveaxis(fABi[:, rows], 0, -2)
+            V = np.var(np.concatenate([a, b], axis=-1), axis=-1)[..., None]
+            S1 = np.mean(b[..., None, :]*(ab - a[..., None, :]), axis=-1)/V
+            ST = 0.5*np.mean((a[..., None, :] - ab)**2, axis=-1)/V
+            return S1, ST
+         S1, ST = indices(rows)
+         S1_b, ST_b = indices(rows[rng.integers(0, len(rows), (bootstrap, len(rows)))])
+         res[name] = {'S1': S1, 'S1_conf': 1.96*np.std(S1_b, axis=0), 
+                      'ST': ST, 'ST_conf': 1.96*np.std(ST_b, axis=0)}
+      else:
+         Y = y.reshape(n, d+1)
+         dU = np.diff(U.reshape(n, d+1, d), axis=1)
+         factor = np.argmax(dU, axis=-1)
+         effects = np.empty((n, d))
+         effects[np.arange(n)[:, None], factor] = np.diff(Y, axis=1)/delta
+         rows = np.flatnonzero(np.all(np.isfinite(effects), axis=1))
+         effects = effects[rows]
+         samples = rng.integers(0, len(rows), (bootstrap, len(rows)))
+         res[name] = {'mu_star': np.mean(np.abs(effects), axis=0), 
+                      'mu_star_conf': 1.96*np.std(np.mean(np.abs(effects[samples]), axis=1), axis=0),
+                      'sigma': np.std(effects, axis=0, ddof=1) if len(rows) > 1 else np.full(d, np.nan)}
+   timing['indices'] = perf_counter() - start
+   res['timing'] = timing
+
+   print('Sensitivity', method, 'with', len(X), 'runs - time [s]:', 
+         ', '.join('{} {:.3g}'.format(stage, t) for stage, t in timing.items()))
+   return res
+
+# Measured chromatograms for estimate()
+def load_chromatogram(filename, axis='volume', columns={'uv': 'uv_detector.value', 
+                                                       'conductivity': 'conductivity_detector.value'}, 
+                      delimiter=','):
+   """Load a measured chromatogram from a text file with a header line. The first column is the 
+      axis as pumped volume [mL] or column volumes [CV] and the columns given are mapped to the 
+      model signals. Returns a dictionary with 'axis', 'x' and the signals."""
+   data = np.genfromtxt(filename, delimiter=delimiter, names=True)
+   names = data.dtype.names
+   measurement = {'axis': axis, 'x': data[names[0]]}
+   for column, signal in columns.items():
+      if column in names: measurement[signal] = data[column]
+   return measurement
+
+def estimate(measurement, bounds, weights=None, starts=4, max_iter=20, tol=1e-4, seed=None, 
+             simulationTime=cycleTime, options=opts_std, workers=None, cache=True):
+   """Estimate the parDict keys in bounds = {key: (low, high)} from a measurement as given by 
+      load_chromatogram(), simulated by default over a full cycle so that the elution is covered, 
+      and simulationTime should reach past the end of the measurement. The simulated signals are 
+      interpolated to the measured volume or CV axis and the residuals are scaled by the range of 
+      each measured signal and weights. 
+      Levenberg-Marquardt is run from the current parDict and starts-1 Latin hypercube points. 
+      The finite difference Jacobians and the trial steps of all starts are simulated together 
+      with simu_batch(). Returns the best estimate with 95% confidence intervals, all starts 
+      and statistics of evaluations and wall-clock time. parDict is not changed."""
+   keys = list(bounds.keys())
+   low = np.array([bounds[k][0] for k in keys], dtype=float)
+   high = np.array([bounds[k][1] for k in keys], dtype=float)
+   signals = [name for name in measurement.keys() if name not in ['axis', 'x']]
+   if weights is None: weights = {name: 1.0 for name in signals}
+   scale = {name: np.ptp(measurement[name]) or 1.0 for name in signals}
+   outputs = signals + ['ackF', 'column.V']
+   stats = {'evaluations': 0, 'simulation_time': 0.0}
+   start_clock = perf_counter()
+
+   def evaluate(points):
+      """Residuals of the points as array (point, residual), inf for failed simulations"""
+      start = perf_counter()
+      batch_res = simu_batch([{k: float(x[j]) for j, k in enumerate(keys)} for x in points], 
+                             simulationTime=simulationTime, outputs=outputs, options=options, 
+                             workers=workers, cache=cache)
+      stats['simulation_time'] += perf_counter() - start
+      stats['evaluations'] += len(points)
+      R = np.full((len(points), len(signals)*len(measurement['x'])), np.inf)
+      for i in np.flatnonzero(batch_res['status'] == 'ok'):
+         valid = ~np.isnan(batch_res['ackF'][i])
+         x_sim = batch_res['ackF'][i][valid]
+         if measurement['axis'] in ['cv', 'CV']: x_sim = x_sim/batch_res['column.V'][i][valid][-1]
+         R[i] = np.concatenate([np.sqrt(weights.get(name, 1.0))/scale[name]*
+                                (np.interp(measurement['x'], x_sim, batch_res[name][i][valid]) - measurement[name])
+                                for name in signals])
+      return R
+
+   # Starting points
+   x0 = np.clip([parDict[k] for k in keys], low, high)
+   design = doe_design(bounds, method='lhs', n=max(starts - 1, 1), seed=seed)
+   X = [x0] + [np.array([design[k][i] for k in keys]) for i in range(starts - 1)]
+   runs = [{'x': x, 'lam': 1e-2, 'done': False, 'iterations': 0} for x in X]
+   for run, r in zip(runs, evaluate(X)): run['r'] = r
+
+   # Levenberg-Marquardt with all starts simulated together
+   for iteration in range(max_iter):
+      active = [run for run in runs if not run['done'] and np.all(np.isfinite(run['r']))]
+      if not active: break
+      h = [1e-3*np.maximum(np.abs(run['x']), 1e-3*(high - low)) for run in active]
+      points = [run['x'] + np.diag(h_run)[j] for run, h_run in zip(active, h) for j in range(len(keys))]
+      R = evaluate(points).reshape(len(active), len(keys), -1)
+      stepping, trials = [], []
+      for run, h_run, R_run in zip(active, h, R):
+         run['J'] = ((R_run - run['r'])/h_run[:, None]).T
+         if not np.all(np.isfinite(run['J'])):
+            run['done'] = True
+            continue
+         JTJ = run['J'].T @ run['J']
+         step = np.linalg.lstsq(JTJ + run['lam']*np.diag(np.diag(JTJ) + 1e-12), -run['J'].T @ run['r'], rcond=None)[0]
+         stepping.append(run)
+         trials.append(np.clip(run['x'] + step, low, high))
+      if not trials: break
+      for run, x, r in zip(stepping, trials, evaluate(trials)):
+         run['iterations'] += 1
+         ssr, ssr_trial = np.sum(run['r']**2), np.sum(r**2)
+         if ssr_trial < ssr:
+            run['done'] = (ssr - ssr_trial) < tol*ssr
+            run['x'], run['r'], run['lam'] = x, r, run['lam']/3
+         else:
+            run['lam'] = run['lam']*3
+            run['done'] = run['lam'] > 1e6
+
+   # Best start with confidence intervals from the Jacobian
+   for run in runs: run['ssr'] = np.sum(run['r']**2)
+   best = min(runs, key=lambda run: run['ssr'])
+   m, n = len(best['r']), len(keys)
+   conf = np.full(n, np.nan)
+   if 'J' in best and np.all(np.isfinite(best['J'])) and m > n:
+      try:
+         covariance = best['ssr']/(m - n)*np.linalg.inv(best['J'].T @ best['J'])
+         conf = 1.96*np.sqrt(np.maximum(np.diag(covariance), 0))
+      except np.linalg.LinAlgError:
+         pass
+   stats['wall_time'] = perf_counter() - start_clock
+   stats['evaluations_per_s'] = stats['evaluations']/max(stats['simulation_time'], 1e-12)
+
+   print('Estimate:', ', '.join('{} = {:.4g} +- {:.2g}'.format(k, x, c) for k, x, c in zip(keys, best['x'], conf)))
+   print('Evaluations:', stats['evaluations'], '- wall-clock time [s]:', np.round(stats['wall_time'], 2),
+         'of which simulation', np.round(stats['simulation_time'], 2))
+   return {'parDict': dict(zip(keys, best['x'].tolist())), 'conf': dict(zip(keys, conf.tolist())),
+           'ssr': best['ssr'], 'starts': [{'x': dict(zip(keys, run['x'].tolist())), 'ssr': run['ssr'], 
+           'iterations': run['iterations']} for run in runs], 'stats': stats}
+
+# Surrogate of the KPIs learnt from the simulations in kpi_observations
+class KPISurrogate:
+   """Gaussian process with squared exponential kernel of the KPIs from pooling_kpi() as function 
+      of the parDict keys, for simulations with the given simulationTime, by default a full cycle. 
+      Inputs are scaled to the range of the observations and KPIs to zero mean and unit variance. 
+      Length scale and noise are chosen by the marginal likelihood. New observations are taken in 
+      at the next predict(), so the surrogate follows simu() and simu_batch() as they are run, also 
+      from the cache, and simu() records the kpi_variables as long as a surrogate is set. New 
+      observations are added incrementally with the same length scale, noise and scaling, while 
+      the fit is made from scratch when observations have been replaced or dropped and when their 
+      number has doubled since the last full fit.
+      Example: surrogate = KPISurrogate(['LFR', 'stop_adsorption']); simu(cycleTime); simu(backend='surrogate')"""
+
+   length_scales = [0.1, 0.2, 0.3, 0.5, 1.0, 2.0]
+   noises = [1e-6, 1e-4, 1e-2]
+
+   def __init__(self, keys, kpis=['purity', 'yield', 'productivity'], simulationTime=cycleTime):
+      self.keys = list(keys)
+      self.kpis = list(kpis)
+      self.simulationTime = simulationTime
+      self.X = np.empty((0, len(self.keys)))
+      self.Y = np.empty((0, len(self.kpis)))
+      self.U = np.empty((0, len(self.keys)))
+      self.taken = []
+      self.skipped = {'time': 0, 'nan': 0}
+      self.seen = 0
+      self.fitted = 0
+      self.n_fit = 0
+
+   def update(self):
+      """Take in the observations in kpi_observations. Returns True when the observations taken in 
+         before are all still there in the same order, ie only new ones have been added."""
+      taken, rows, values = [], [], []
+      self.skipped = {'time': 0, 'nan': 0}
+      for key, (parDict_run, time, kpi) in kpi_observations.items():
+         if time != self.simulationTime:
+            self.skipped['time'] += 1
+            continue
+         y = [kpi[k] for k in self.kpis]
+         if not np.all(np.isfinite(y)):
+            self.skipped['nan'] += 1
+            continue
+         taken.append(key)
+         rows.append([parDict_run[k] for k in self.keys])
+         values.append(y)
+      appended = taken[:len(self.taken)] == self.taken
+      self.taken = taken
+      self.seen = kpi_observations_added
+      self.X = np.array(rows, dtype=float).reshape(-1, len(self.keys))
+      self.Y = np.array(values, dtype=float).reshape(-1, len(self.kpis))
+      return appended
+
+   def kernel(self, A, B):
+      d = (A[:, None, :] - B[None, :, :])/self.length_scale
+      return np.exp(-0.5*np.sum(d**2, axis=-1))
+
+   def fit(self):
+      """Fit from scratch to all observations taken in by update()"""
+      n = len(self.X)
+      self.n_fit = n
+      if n == 0: 
+         self.U = np.empty((0, len(self.keys)))
+         return
+      self.low = self.X.min(axis=0)
+      self.span = np.where(self.X.max(axis=0) > self.low, self.X.max(axis=0) - self.low, 1)
+      self.mean = self.Y.mean(axis=0)
+      self.std = np.where(self.Y.std(axis=0) > 0, self.Y.std(axis=0), 1)
+      U = (self.X - self.low)/self.span
+      Y = (self.Y - self.mean)/self.std
+      best = None
+      for length_scale in self.length_scales:
+         self.length_scale = length_scale
+         K0 = self.kernel(U, U)
+         for noise in self.noises:
+            try:
+               L = np.linalg.cholesky(K0 + noise*np.eye(n))
+            except np.linalg.LinAlgError:
+               continue
+            alpha = np.linalg.solve(L.T, np.linalg.solve(L, Y))
+            likelihood = -0.5*np.sum(Y*alpha) - Y.shape[1]*np.sum(np.log(np.diag(L)))
+            if best is None or likelihood > best[0]: best = (likelihood, length_scale, noise, L, alpha)
+      _, self.length_scale, self.noise, L, self.alpha = best
+      L_inv = np.linalg.solve(L, np.eye(n))
+      self.K_inv = L_inv.T @ L_inv
+      self.U = U
+      self.Y_scaled = Y
+
+   def extend(self):
+      """Add the observations after those already fitted, with the inverse of the kernel matrix 
+         extended block-wise by the Schur complement of the new observations"""
+      U_new = (self.X[len(self.U):] - self.low)/self.span
+      Y_new = (self.Y[len(self.U):] - self.mean)/self.std
+      B = self.kernel(self.U, U_new)
+      KB = self.K_inv @ B
+      S_inv = np.linalg.inv(self.kernel(U_new, U_new) + self.noise*np.eye(len(U_new)) - B.T @ KB)
+      self.K_inv = np.block([[self.K_inv + KB @ S_inv @ KB.T, -KB @ S_inv], [-S_inv @ KB.T, S_inv]])
+      self.U = np.vstack([self.U, U_new])
+      self.Y_scaled = np.vstack([self.Y_scaled, Y_new])
+      self.alpha = self.K_inv @ self.Y_scaled
+
+   def predict(self, values=None):
+      """KPIs estimated for a parDict, by default the current, as dictionary of (mean, standard deviation)"""
+      if values is None: values = parDict
+      if self.fitted < kpi_observations_added:
+         appended = self.update()
+         if not appended or self.n_fit == 0 or len(self.X) >= 2*self.n_fit: self.fit()
+         elif len(self.X) > len(self.U): self.extend()
+         self.fitted = self.seen
+      if len(self.X) == 0:
+         print('Error: No observations for the surrogate with simulationTime', self.simulationTime, '-', 
+               self.skipped['time'], 'with other simulationTime and', self.skipped['nan'], 
+               'with KPIs nan, eg without pooling')
+         return None
+      u = (np.array([values[k] for k in self.keys], dtype=float) - self.low)/self.span
+      k = self.kernel(u[None, :], self.U)[0]
+      variance = max(1 + self.noise - k @ self.K_inv @ k, 0)
+      mean = self.mean + self.std*(k @ self.alpha)
+      return {kpi: (mean[j], self.std[j]*np.sqrt(variance)) for j, kpi in enumerate(self.kpis)}
+
+global surrogate; surrogate = None
+
+# Campaign of many cycles
+def campaign(cycles, cycleTime, mode='Initial', options=opts_std, outputs=None, cache=False, store=None):
+   """Simulate cycles of length cycleTime back to back with the warm FMU. The schedules in 
+      cycle_schedules start again at each cycle and the states are carried over. Yields for 
+      each cycle a dictionary with 'cycle', 'start', 'stop' and the KPIs from cycle_kpi(), and
+      with outputs given also 'sim_res' for the cycle with NCP points. Without outputs only 
+      the start and the end of each cycle is recorded so memory use does not grow. With store
+      given as a ResultStore the recorded result of each cycle is appended to it on disk.
+      Example: kpi = [x['purity'] for x in campaign(100, 1400)]"""
+
+   global sim_res, prevFinalTime, current_snapshot
+
+   if not solver_check(options): return
+
+   if mode in ['Initial', 'initial', 'init']:
+      start_time = 0
+      state_values = {}
+   elif mode in ['Continued', 'continued', 'cont']:
+      if prevFinalTime == 0:
+         print("Error: Simulation is first done with default mode = init'")
+         return
+      start_time = prevFinalTime
+      state_values = {stateDictInitial[key]:stateDict[key] for key in stateDictInitial.keys()}
+   else:
+      print("Error: Simulation mode not correct")
+      return
+
+   parameter_values = {parLocation[k]:parDict[k] for k in parDict.keys()}
+   state_names = list(stateDictInitial.keys())
+   output = list(set(state_names + cycle_variables + (outputs or [])))
+   output_interval = cycleTime/options['NCP'] if outputs else cycleTime
+
+   for n_cycle in range(1, cycles+1):
+      start_values = dict(parameter_values)
+      start_values.update(state_values)
+      start_values.update({name:start_time for name in cycle_schedules})
+      result = cached_simulate(
+         cache = cache,
+         start_time = start_time,
+         stop_time = start_time + cycleTime,
+         output_interval = output_interval,
+         record_events = bool(outputs),
+         solver = solver_settings(options, cycleTime/options['NCP']),
+         start_values = start_values,
+         output = output
+      )
+      state_values = {stateDictInitial[key]:value for key, value in 
+                      zip(state_names, result[state_names][-1].tolist())}
+
+      # Make the end of the cycle the state for a following simu(mode='cont')
+      stateDict.update(zip(state_names, result[state_names][-1].tolist()))
+      prevFinalTime = result['time'][-1]
+      current_snapshot = Snapshot(prevFinalTime, stateDict, parDict, engine.fmu_hash())
+
+      cycle_res = {'cycle': n_cycle, 'start': start_time, 'stop': prevFinalTime}
+      cycle_res.update(cycle_kpi(result[0], result[-1]))
+      if outputs: 
+         sim_res = result
+         cycle_res['sim_res'] = result
+      if store is not None: store.append(result)
+      yield cycle_res
+      start_time = prevFinalTime
+
+# Replay of control_pooling on a recorded outlet trajectory
+global replay_variables; replay_variables = []
+replay_variables.append('uv_detector.value')
+replay_variables.append('column.column_section[8].outlet.c[1]')
+replay_variables.append('column.column_section[8].outlet.c[2]')
+replay_variables.append('ackF')
+
+def result_scaling(sim_res):
+   """Scale factor of the switch points that sim_res was simulated with, see switch_scaling()"""
+   names = sim_res.dtype.names
+   if 'scaling' in names: return float(sim_res['scaling'][0])
+   if 'scale_volume' in names and 'F' in names: return float(sim_res['F'][0]) if sim_res['scale_volume'][0] else 1
+   return switch_scaling()
+
+def pooling_replay(start_uv=None, stop_uv=None, start_pooling=None, stop_pooling=None, sim_res=None):
+   """Pooling of sim_res, by default the last simulation, replayed for other values of start_uv, 
+      stop_uv, start_pooling and stop_pooling without new simulation. The arguments broadcast 
+      against each other, eg a meshgrid, and are by default taken from parDict. The hysteresis of 
+      control_pooling switches on when UV is above start_uv and off when below stop_uv, and the 
+      pool is collected when also inside the time window, where the crossings are interpolated 
+      between the samples. The switch points are scaled as when sim_res was simulated. Returns a dictionary of arrays with the 
+      broadcast shape: P_harvest and A_harvest [mg], purity and yield relative to all product 
+      at the outlet. The result sim_res must have replay_variables and the model time axis."""
+   if sim_res is None: sim_res = globals()['sim_res']
+   candidates = [parDict[k] if x is None else x for k, x in 
+                 zip(['start_uv', 'stop_uv', 'start_pooling', 'stop_pooling'], 
+                     [start_uv, stop_uv, start_pooling, stop_pooling])]
+   shape = np.broadcast(*candidates).shape
+   high, low, start, stop = [np.broadcast_to(np.asarray(x, dtype=float), shape).reshape(-1, 1) for x in candidates]
+
+   time = sim_res['time']
+   uv = np.asarray(sim_res['uv_detector.value'])
+   P = np.asarray(sim_res['column.column_section[8].outlet.c[1]'])
+   A = np.asarray(sim_res['column.column_section[8].outlet.c[2]'])
+   dV = np.diff(np.asarray(sim_res['ackF']))
+
+   # Hysteresis state is given by the last sample where UV was above high or below low
+   above = uv > high
+   decisive = above | (uv < low)
+   last = np.maximum.accumulate(np.where(decisive, np.arange(len(time)), -1), axis=1)
+   y = np.take_along_axis(above, np.maximum(last, 0), axis=1) & (last >= 0)
+
+   scaling = result_scaling(sim_res)
+   window = (time >= start/scaling) & (time < stop/scaling)
+   out = y & window
+
+   # Part [theta_on, theta_off] of each sample interval where the pool is collected, with the 
+   # crossings of UV and of the time window interpolated linearly inside the interval
+   with np.errstate(divide='ignore', invalid='ignore'):
+      def crossing(x, level):
+         return np.nan_to_num(np.clip((level - x[..., :-1])/(x[..., 1:] - x[..., :-1]), 0, 1))
+      turned = lambda b: ~b[:, :-1] & b[:, 1:]
+      theta_on = np.maximum(np.where(turned(y), crossing(uv, high), 0), 
+                            np.where(turned(window), crossing(time, start/scaling), 0))
+      theta_off = np.minimum(np.where(turned(~y), crossing(uv, low), 1), 
+                             np.where(turned(~window), crossing(time, stop/scaling), 1))
+   theta_on = np.where(out[:, :-1], 0, theta_on)
+   theta_off = np.where(out[:, 1:], 1, theta_off)
+   collected = (out[:, :-1] | out[:, 1:]) & (theta_off > theta_on)
+   theta_on, theta_off = np.where(collected, theta_on, 0), np.where(collected, theta_off, 0)
+
+   # Integration over the pumped volume, exact for c linear inside each interval
+   def harvest(c):
+      middle = 0.5*(theta_on + theta_off)
+      return ((theta_off - theta_on)*(c[:-1] + (c[1:] - c[:-1])*middle)*dV).sum(axis=1)
+   P_harvest, A_harvest = harvest(P), harvest(A)
+   P_total = (0.5*(P[:-1] + P[1:])*dV).sum()
+   with np.errstate(divide='ignore', invalid='ignore'):
+      replay = {'P_harvest': P_harvest, 'A_harvest': A_harvest,
+                'purity': np.where(P_harvest + A_harvest > 0, P_harvest/(P_harvest + A_harvest), np.nan),
+                'yield': P_harvest/P_total}
+   return {key: value.reshape(shape) for key, value in replay.items()}
+
+def pooling_replay_check(points, simulationTime=simulationTime, options=opts_std):
+   """Compare pooling_replay() with simulation for a few points (start_uv, stop_uv, start_pooling, 
+      stop_pooling), where None keeps the value in parDict. Returns the relative differences of 
+      P_harvest and A_harvest per point, nan where the simulation harvests nothing. parDict is 
+      unchanged afterwards. The difference is set by the sampling of the outlet, below 1e-4 with 
+      a uniform grid and some 0.5 % with the 'phase' grid where UV crosses in the coarse part."""
+   parDict_saved = parDict.copy()
+   simu(simulationTime, options=options, diagrams=replay_variables, plot=False)
+   base = sim_res
+   differences = []
+   try:
+      for point in points:
+         x = {k: v for k, v in zip(['start_uv', 'stop_uv', 'start_pooling', 'stop_pooling'], point) if v is not None}
+         replay = pooling_replay(sim_res=base, **x)
+         par(**x)
+         simu(simulationTime, options=options, diagrams=replay_variables, plot=False)
+         kpi = pooling_kpi(sim_res)
+         difference = [abs(replay[k] - kpi[k])/abs(kpi[k]) if kpi[k] != 0 else np.nan for k in ['P_harvest', 'A_harvest']]
+         print(point, '- relative difference P_harvest:', np.round(difference[0], 4), 'A_harvest:', np.round(difference[1], 4))
+         differences.append(difference)
+         parDict.update(parDict_saved)
+   finally:
+      parDict.update(parDict_saved)
+   return np.array(differences)
+
 # Describe model parts of the combined system
 def describe_parts(component_list=[]):
    """List all parts of the model""" 
@@ -1304,7 +3451,7 @@ def describe_parts(component_list=[]):
       return name
     
 #   variables = list(model.get_model_variables().keys())
-   variables = [v.name for v in model_description.modelVariables]
+   variables = list(engine.registry().keys())
         
    for i in range(len(variables)):
       component = model_component(variables[i])
@@ -1327,35 +3474,20 @@ def describe_general(name, decimals):
       unit = 'h'
       print(description,'[',unit,']')
       
-   elif name in parLocation.keys():
-      description = model_get_variable_description(parLocation[name])
-      value = model_get(parLocation[name])
-      try:
-         unit = model_get_variable_unit(parLocation[name])
-      except FMUException:
-         unit =''
-      if unit =='':
-         if type(value) != np.bool_:
-            print(description, ':', np.round(value, decimals))
-         else:
-            print(description, ':', value)            
-      else:
-        print(description, ':', np.round(value, decimals), '[',unit,']')
-                  
    else:
+      if name in parLocation.keys(): name = parLocation[name]
       description = model_get_variable_description(name)
       value = model_get(name)
-      try:
-         unit = model_get_variable_unit(name)
-      except FMUException:
-         unit =''
-      if unit =='':
-         if type(value) != np.bool_:
+      unit = model_get_variable_unit(name)
+      if unit in ['', None]:
+         if not isinstance(value, (bool, np.bool_)):
             print(description, ':', np.round(value, decimals))
          else:
-            print(description, ':', value)     
-      else:
+            print(description, ':', value)            
+      elif not isinstance(value, (bool, np.bool_)):
          print(description, ':', np.round(value, decimals), '[',unit,']')
+      else:
+         print(description, ':', value, '[',unit,']')
 
 # Plot process diagram
 def process_diagram(fmu_model=fmu_model, fmu_process_diagram=fmu_process_diagram):   
@@ -1392,7 +3524,7 @@ def BPL_info():
 def system_info():
    """Print system information"""
 #   FMU_type = model.__class__.__name__
-   constants = [v for v in model_description.modelVariables if v.causality == 'local']
+   meta = engine.metadata()
    
    print()
    print('System information')
@@ -1404,14 +3536,11 @@ def system_info():
    except NameError:
        print(' -Scipy: not installed in the notebook')
    print(' -FMPy:', version('fmpy'))
-   print(' -FMU by:', read_model_description(fmu_model).generationTool)
-   print(' -FMI:', read_model_description(fmu_model).fmiVersion)
-   if model_description.modelExchange is None:
-      print(' -Type: CS')
-   else:
-      print(' -Type: ME')
-   print(' -Name:', read_model_description(fmu_model).modelName)
-   print(' -Generated:', read_model_description(fmu_model).generationDateAndTime)
+   print(' -FMU by:', meta['generationTool'])
+   print(' -FMI:', meta['fmiVersion'])
+   print(' -Type:', meta['type'])
+   print(' -Name:', meta['modelName'])
+   print(' -Generated:', meta['generationDateAndTime'])
    print(' -MSL:', MSL_version)    
    print(' -Description:', BPL_version)   
    print(' -Interaction:', FMU_explore)